@@ -0,0 +1,75 @@
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+SHARED_CACHE_KEY = 'auth_token:{}'
+# Метка отозванного токена: запись, прочитанная из базы до отзыва,
+# не перезапишет ее, потому что записи добавляются через cache.add.
+REVOKED = b'revoked'
+
+
+def get_shared_cache():
+    alias = settings.AUTH_TOKEN_CACHE['SHARED_CACHE']
+    return caches[alias] if alias else None
+
+
+def invalidate_tokens(keys):
+    """
+    Отзывает записи токенов в общем кеше. Вызывается после фиксации
+    транзакции, иначе другой процесс успеет закешировать старую строку.
+    """
+    shared_cache = get_shared_cache()
+    keys = list(keys)
+    if shared_cache is not None and keys:
+        shared_cache.set_many(
+            {SHARED_CACHE_KEY.format(key): REVOKED for key in keys},
+            settings.AUTH_TOKEN_CACHE['SHARED_TTL'],
+        )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который хранит пары (user, token) в общем кеше
+    AUTH_TOKEN_CACHE['SHARED_CACHE'].
+
+    Записи хранятся сериализованными, поэтому каждый запрос получает свой
+    экземпляр пользователя. Выход из системы, удаление токена и изменение
+    пользователя отзывают записи во всех процессах сразу; отозванный
+    токен проверяется по базе.
+    """
+
+    def get_cached(self, key):
+        shared_cache = get_shared_cache()
+        if shared_cache is None:
+            return None
+        cached = shared_cache.get(SHARED_CACHE_KEY.format(key))
+        if cached is None or cached == REVOKED:
+            return None
+        return pickle.loads(cached)
+
+    def set_cached(self, key, value):
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            shared_cache.add(
+                SHARED_CACHE_KEY.format(key),
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                settings.AUTH_TOKEN_CACHE['SHARED_TTL'],
+            )
+
+    def authenticate_credentials(self, key):
+        cached = self.get_cached(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            self.set_cached(key, cached)
+            return cached
+
+        user, token = cached
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return user, token
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Warning, register
+
+from api.throttling import RedisCache
+
+
+@register()
+def events_broker_check(app_configs, **kwargs):
+    if settings.DEBUG or not settings.EVENTS['BROKER'].endswith(
+        '.InProcessBroker'
+    ):
+        return []
+    return [Warning(
+        'InProcessBroker раздает события только подписчикам своего '
+        'процесса.',
+        hint=(
+            'Задайте REDIS_URL или запускайте API и события в одном '
+            'ASGI-воркере.'
+        ),
+        id='api.W001',
+    )]
+
+
+@register()
+def throttling_cache_check(app_configs, **kwargs):
+    cache = caches[settings.THROTTLING['CACHE']]
+    if settings.DEBUG or (
+        RedisCache is not None and isinstance(cache, RedisCache)
+    ):
+        return []
+    if isinstance(cache, LocMemCache):
+        return [Warning(
+            'Лимиты запросов хранятся в памяти процесса, и каждый воркер '
+            'считает их отдельно.',
+            hint='Задайте REDIS_URL или THROTTLE_CACHE с django-redis.',
+            id='api.W002',
+        )]
+    return [Warning(
+        'Лимиты запросов обновляются неатомарно: одновременные запросы '
+        'разных воркеров могут превысить лимит.',
+        hint='Задайте REDIS_URL или THROTTLE_CACHE с django-redis.',
+        id='api.W003',
+    )]
@@ -0,0 +1,71 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import quote_etag
+
+from recipes.models import (
+    FavoriteRecipe, Recipe,
+    RecipeInShoppingCart, Subscription
+)
+
+RELATION_MODELS = [FavoriteRecipe, RecipeInShoppingCart, Subscription]
+
+
+def relation_subquery(model, aggregate):
+    return Subquery(
+        model.objects.filter(
+            user=OuterRef('pk')
+        ).order_by().values('user').annotate(
+            value=aggregate
+        ).values('value')
+    )
+
+
+def relations_version(user):
+    """
+    Версия избранного, корзины и подписок пользователя.
+
+    Количество строк меняется при удалении, максимальный id — при
+    добавлении, поэтому пара (count, max id) меняется при любом изменении.
+    """
+    if not user or user.is_anonymous:
+        return ()
+    annotations = {}
+    for model in RELATION_MODELS:
+        name = model._meta.model_name
+        annotations[f'{name}_count'] = relation_subquery(model, Count('id'))
+        annotations[f'{name}_max_id'] = relation_subquery(model, Max('id'))
+    return tuple(
+        type(user).objects.filter(pk=user.pk).annotate(
+            **annotations
+        ).values_list(*annotations).first() or ()
+    )
+
+
+def recipes_version(queryset):
+    return tuple(
+        queryset.aggregate(
+            updated_at=Max('updated_at'),
+            count=Count('id', distinct=True),
+        ).values()
+    )
+
+
+def recipe_version(pk):
+    try:
+        return tuple(
+            Recipe.objects.filter(pk=pk).values_list('updated_at', flat=True)
+        )
+    except (TypeError, ValueError, ValidationError):
+        return ()
+
+
+def make_etag(request, *versions):
+    key = '|'.join([
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+        str(request.user.pk),
+        *map(repr, versions),
+    ])
+    return 'W/' + quote_etag(hashlib.md5(key.encode()).hexdigest())
@@ -0,0 +1,326 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from rest_framework import exceptions
+
+from api.authentication import CachedTokenAuthentication
+from recipes.models import Recipe, Subscription
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+RECIPES_CHANNEL = 'recipes'
+TICKET_SALT = 'api.events.ticket'
+
+
+class InProcessBroker:
+    """
+    Pub/sub в памяти процесса.
+
+    Сообщения получают только подписчики того же процесса, поэтому
+    брокер подходит, только если API и события обслуживает один
+    ASGI-воркер (foodgram.asgi, GUNICORN_WORKERS=1).
+    publish можно вызывать из любого потока, подписчики читают
+    сообщения в своем event loop.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel, message):
+        """Раздает сообщение подписчикам этого процесса."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self.deliver, queue, message)
+
+    @staticmethod
+    def deliver(queue, message):
+        # Медленный клиент пропускает события и получит их из базы
+        # при переподключении с Last-Event-ID.
+        if not queue.full():
+            queue.put_nowait(message)
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=settings.EVENTS['QUEUE_SIZE'])
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            self._subscribers.get(channel, set()).discard(subscriber)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Pub/sub через Redis для нескольких ASGI-процессов.
+
+    publish отправляет сообщение в Redis, фоновый поток каждого процесса
+    получает сообщения всех каналов и раздает их своим подписчикам.
+    Сообщения, опубликованные во время переподключения к Redis,
+    теряются, клиенты получат их из базы по Last-Event-ID.
+    """
+    prefix = 'events:'
+
+    def __init__(self):
+        if redis is None:
+            raise ImproperlyConfigured('Для RedisBroker нужен пакет redis.')
+        super().__init__()
+        self._client = redis.Redis.from_url(settings.EVENTS['REDIS_URL'])
+        self._listener = None
+
+    def publish(self, channel, message):
+        self._client.publish(
+            self.prefix + channel, json.dumps(message, ensure_ascii=False)
+        )
+
+    def subscribe(self, channel):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self.listen, name='redis-events', daemon=True
+                )
+                self._listener.start()
+        return super().subscribe(channel)
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                for item in pubsub.listen():
+                    channel = item['channel'].decode()[len(self.prefix):]
+                    self.dispatch(channel, json.loads(item['data']))
+            except redis.RedisError:
+                logger.exception('Потеряно соединение с Redis.')
+                time.sleep(settings.EVENTS['RECONNECT_DELAY'])
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.EVENTS['BROKER'])()
+    return _broker
+
+
+def recipe_event(recipe):
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'author': recipe.author_id,
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def publish_recipe_created(recipe):
+    get_broker().publish(RECIPES_CHANNEL, recipe_event(recipe))
+
+
+def format_event(event):
+    data = json.dumps(event, ensure_ascii=False)
+    return f'id: {event["id"]}\nevent: recipe\ndata: {data}\n\n'.encode()
+
+
+def database_sync_to_async(func):
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+def make_ticket(user):
+    return signing.dumps(user.pk, salt=TICKET_SALT)
+
+
+def ticket_user(ticket):
+    """Владелец билета или None, если билет подделан или истек."""
+    try:
+        pk = signing.loads(
+            ticket, salt=TICKET_SALT, max_age=settings.EVENTS['TICKET_TTL']
+        )
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=pk, is_active=True).first()
+
+
+@database_sync_to_async
+def authenticate(key, ticket):
+    if key is None:
+        return ticket_user(ticket)
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    except exceptions.AuthenticationFailed:
+        return None
+    return user
+
+
+@database_sync_to_async
+def followed_authors(user):
+    return set(Subscription.objects.filter(
+        user=user
+    ).values_list('author_id', flat=True))
+
+
+@database_sync_to_async
+def missed_recipes(authors, last_event_id):
+    recipes = Recipe.objects.filter(
+        author_id__in=authors, id__gt=last_event_id
+    ).order_by('id')[:settings.EVENTS['RESUME_LIMIT']]
+    return [recipe_event(recipe) for recipe in recipes]
+
+
+def request_params(scope):
+    headers = {
+        name.decode('latin1').lower(): value.decode('latin1')
+        for name, value in scope['headers']
+    }
+    query = parse_qs(scope.get('query_string', b'').decode())
+    token = None
+    authorization = headers.get('authorization', '').split()
+    if len(authorization) == 2 and authorization[0].lower() == 'token':
+        token = authorization[1]
+    ticket = query.get('ticket', [None])[0]
+    last_event_id = headers.get(
+        'last-event-id', query.get('last_event_id', [''])[0]
+    )
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = None
+    return token, ticket, last_event_id
+
+
+class RecipeEventsApp:
+    """
+    ASGI-приложение с потоком событий (SSE) о новых рецептах авторов,
+    на которых подписан пользователь.
+
+    id события равен id рецепта, поэтому после переподключения
+    с Last-Event-ID пропущенные рецепты досылаются из базы.
+    Токен передается в заголовке Authorization. EventSource не умеет
+    отправлять заголовки, поэтому браузер вместо токена передает
+    в параметре ticket короткоживущий билет из POST
+    /api/users/events_ticket/.
+    """
+
+    async def respond(self, send, status, body=b''):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            return await self.respond(send, 405)
+        token, ticket, last_event_id = request_params(scope)
+        user = (
+            await authenticate(token, ticket) if token or ticket else None
+        )
+        if user is None:
+            return await self.respond(
+                send, 401, b'{"detail":"Authentication required."}'
+            )
+
+        broker = get_broker()
+        subscriber = broker.subscribe(RECIPES_CHANNEL)
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await self.stream(
+                send, user, subscriber[1], last_event_id, disconnected
+            )
+        finally:
+            disconnected.cancel()
+            broker.unsubscribe(RECIPES_CHANNEL, subscriber)
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_event(self, send, event):
+        await send({
+            'type': 'http.response.body',
+            'body': format_event(event),
+            'more_body': True,
+        })
+
+    async def stream(self, send, user, queue, last_event_id, disconnected):
+        loop = asyncio.get_running_loop()
+        authors = await followed_authors(user)
+        authors_loaded_at = loop.time()
+        # События, уже отправленные из базы, приходят и через брокер,
+        # если рецепт создан во время досылки.
+        resumed_id = last_event_id or 0
+        while last_event_id is not None:
+            events = await missed_recipes(authors, resumed_id)
+            for event in events:
+                await self.send_event(send, event)
+                resumed_id = event['id']
+            if len(events) < settings.EVENTS['RESUME_LIMIT']:
+                break
+
+        while not disconnected.done():
+            get_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                [get_event, disconnected],
+                timeout=settings.EVENTS['HEARTBEAT'],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if get_event not in done:
+                get_event.cancel()
+                if not disconnected.done():
+                    await send({
+                        'type': 'http.response.body',
+                        'body': b': ping\n\n',
+                        'more_body': True,
+                    })
+                continue
+
+            event = get_event.result()
+            if (
+                loop.time() - authors_loaded_at
+                > settings.EVENTS['FOLLOWING_TTL']
+            ):
+                authors = await followed_authors(user)
+                authors_loaded_at = loop.time()
+            if event['author'] in authors and event['id'] > resumed_id:
+                await self.send_event(send, event)
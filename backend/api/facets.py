@@ -0,0 +1,104 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+
+from recipes.models import (
+    TAGS_MASK_SIZE, FavoriteRecipe,
+    Recipe, RecipeInShoppingCart, Tag
+)
+
+FACETS_CACHE_KEY = 'recipe_facets:{}'
+
+# Параметры, которые не меняют набор рецептов.
+IGNORED_PARAMS = ['page', 'limit', 'facets']
+
+
+def facets_requested(request):
+    return request.query_params.get('facets') in ('1', 'true', 'True')
+
+
+def filter_signature(request):
+    params = sorted(
+        (key, sorted(request.query_params.getlist(key)))
+        for key in request.query_params
+        if key not in IGNORED_PARAMS
+    )
+    key = f'{request.user.pk}|{params!r}'
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def cooking_time_buckets():
+    """Интервалы времени приготовления в виде пар (min, max)."""
+    bounds = settings.RECIPE_FACETS['COOKING_TIME_BUCKETS']
+    lower = [1] + [bound + 1 for bound in bounds]
+    return list(zip(lower, bounds + [None]))
+
+
+def tag_count(tag_id):
+    if tag_id <= TAGS_MASK_SIZE:
+        # Бит тега, сдвинутый в младший разряд, равен 0 или 1.
+        return Sum(F('tags_mask').bitand(1 << (tag_id - 1)).bitrightshift(
+            tag_id - 1
+        ))
+    return Count('pk', filter=Q(Exists(Recipe.tags.through.objects.filter(
+        recipe_id=OuterRef('pk'), tag_id=tag_id
+    ))))
+
+
+def count_facets(queryset, user):
+    """
+    Счетчики по тегам, времени приготовления, избранному и корзине
+    одним агрегирующим запросом.
+    """
+    tags = list(Tag.objects.values_list('id', 'slug'))
+    buckets = cooking_time_buckets()
+    queryset = Recipe.objects.filter(pk__in=queryset.values('pk'))
+
+    aggregates = {
+        f'tag_{tag_id}': tag_count(tag_id) for tag_id, _ in tags
+    }
+    for index, (low, high) in enumerate(buckets):
+        condition = Q(cooking_time__gte=low)
+        if high is not None:
+            condition &= Q(cooking_time__lte=high)
+        aggregates[f'cooking_time_{index}'] = Count('pk', filter=condition)
+    is_authenticated = user and user.is_authenticated
+    if is_authenticated:
+        for name, model in [
+            ('is_favorited', FavoriteRecipe),
+            ('is_in_shopping_cart', RecipeInShoppingCart),
+        ]:
+            aggregates[name] = Count('pk', filter=Q(Exists(
+                model.objects.filter(user=user, recipe_id=OuterRef('pk'))
+            )))
+    counts = queryset.aggregate(**aggregates)
+
+    facets = {
+        'tags': {
+            slug: int(counts[f'tag_{tag_id}'] or 0) for tag_id, slug in tags
+        },
+        'cooking_time': [
+            {
+                'min': low,
+                'max': high,
+                'count': counts[f'cooking_time_{index}'],
+            }
+            for index, (low, high) in enumerate(buckets)
+        ],
+    }
+    if is_authenticated:
+        facets['is_favorited'] = counts['is_favorited']
+        facets['is_in_shopping_cart'] = counts['is_in_shopping_cart']
+    return facets
+
+
+def recipe_facets(queryset, request):
+    """Счетчики для отфильтрованных рецептов, закешированные по фильтру."""
+    key = FACETS_CACHE_KEY.format(filter_signature(request))
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_facets(queryset, request.user)
+        cache.set(key, facets, settings.RECIPE_FACETS['CACHE_TTL'])
+    return facets
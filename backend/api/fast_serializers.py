@@ -0,0 +1,235 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+
+from api.fields import FieldSelection
+from api.relations import user_relations
+from recipes.models import Recipe, RecipeIngredient
+
+User = get_user_model()
+
+
+class ValuesSerializer:
+    """
+    Сериализатор строк из queryset.values() в обычные словари.
+
+    Повторяет вывод соответствующего ModelSerializer, но не создает
+    экземпляры моделей и полей DRF.
+    """
+    fields = []
+
+    def __init__(self, instance=None, many=False, context=None):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.prefetch_related(None).values(*cls.fields)
+
+    @property
+    def request(self):
+        return self.context.get('request')
+
+    def to_representation_many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+    def to_representation(self, row):
+        return {field: row[field] for field in self.fields}
+
+    @property
+    def data(self):
+        if self.many:
+            return self.to_representation_many(list(self.instance))
+        return self.to_representation_many([self.instance])[0]
+
+
+class TagValuesSerializer(ValuesSerializer):
+    fields = [
+        'id',
+        'name',
+        'color',
+        'slug',
+    ]
+
+
+class IngredientValuesSerializer(ValuesSerializer):
+    fields = [
+        'id',
+        'name',
+        'measurement_unit',
+    ]
+
+
+class ImageURLMixin:
+    image_storage = Recipe._meta.get_field('image').storage
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = self.image_storage.url(name)
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+
+class ShortRecipeValuesSerializer(ImageURLMixin, ValuesSerializer):
+    fields = [
+        'id',
+        'name',
+        'image',
+        'cooking_time',
+    ]
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'image': self.image_url(row['image']),
+            'cooking_time': row['cooking_time'],
+        }
+
+
+class RecipeValuesSerializer(ImageURLMixin, ValuesSerializer):
+    fields = [
+        'id',
+        'author_id',
+        'name',
+        'image',
+        'text',
+        'cooking_time',
+    ]
+    output_fields = [
+        'id',
+        'tags',
+        'author',
+        'ingredients',
+        'is_favorited',
+        'is_in_shopping_cart',
+        'name',
+        'image',
+        'text',
+        'cooking_time',
+    ]
+
+    def get_authors(self, author_ids):
+        authors = User.objects.filter(id__in=author_ids).values(
+            'email', 'id', 'username', 'first_name', 'last_name',
+        )
+        subscribed = user_relations(self.request).subscriptions
+        result = {}
+        for author in authors:
+            author['is_subscribed'] = author['id'] in subscribed
+            result[author['id']] = author
+        return result
+
+    def get_tags(self, recipe_ids):
+        rows = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'recipe_id', 'tag__id', 'tag__name', 'tag__color', 'tag__slug',
+        ).order_by('tag__name')
+        result = defaultdict(list)
+        for recipe_id, *tag in rows:
+            result[recipe_id].append(
+                dict(zip(TagValuesSerializer.fields, tag))
+            )
+        return result
+
+    def get_ingredients(self, recipe_ids):
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'recipe_id',
+            'ingredient__id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        result = defaultdict(list)
+        for recipe_id, ingredient_id, name, measurement_unit, amount in rows:
+            result[recipe_id].append({
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            })
+        return result
+
+    @classmethod
+    def values(cls, queryset, selection=None):
+        fields = cls.fields
+        if selection is not None and not selection.includes('text'):
+            fields = [field for field in fields if field != 'text']
+        return queryset.prefetch_related(None).values(*fields)
+
+    def get_tag_ids(self, recipe_ids):
+        rows = Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag_id').order_by('tag__name')
+        result = defaultdict(list)
+        for recipe_id, tag_id in rows:
+            result[recipe_id].append(tag_id)
+        return result
+
+    def get_ingredient_amounts(self, recipe_ids):
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'recipe_id', 'ingredient_id', 'amount',
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        result = defaultdict(list)
+        for recipe_id, ingredient_id, amount in rows:
+            result[recipe_id].append({'id': ingredient_id, 'amount': amount})
+        return result
+
+    def get_columns(self, rows):
+        """Значения полей рецептов по id, только для выбранных полей."""
+        selection = self.context.get('field_selection') or FieldSelection()
+        recipe_ids = [row['id'] for row in rows]
+        columns = {}
+        if selection.expands('author'):
+            authors = self.get_authors({row['author_id'] for row in rows})
+            columns['author'] = {
+                row['id']: authors[row['author_id']] for row in rows
+            }
+        elif selection.includes('author'):
+            columns['author'] = {row['id']: row['author_id'] for row in rows}
+        if selection.expands('tags'):
+            columns['tags'] = self.get_tags(recipe_ids)
+        elif selection.includes('tags'):
+            columns['tags'] = self.get_tag_ids(recipe_ids)
+        if selection.expands('ingredients'):
+            columns['ingredients'] = self.get_ingredients(recipe_ids)
+        elif selection.includes('ingredients'):
+            columns['ingredients'] = self.get_ingredient_amounts(recipe_ids)
+        relations = user_relations(self.request)
+        for name, related_ids in [
+            ('is_favorited', relations.favorites),
+            ('is_in_shopping_cart', relations.shopping_cart),
+        ]:
+            if selection.includes(name):
+                columns[name] = {
+                    recipe_id: recipe_id in related_ids
+                    for recipe_id in recipe_ids
+                }
+        for name in ['id', 'name', 'text', 'cooking_time']:
+            if selection.includes(name):
+                columns[name] = {row['id']: row[name] for row in rows}
+        if selection.includes('image'):
+            columns['image'] = {
+                row['id']: self.image_url(row['image']) for row in rows
+            }
+        return [
+            (name, columns[name]) for name in self.output_fields
+            if name in columns
+        ]
+
+    def to_representation_many(self, rows):
+        if not rows:
+            return []
+        columns = self.get_columns(rows)
+        return [
+            {name: values[row['id']] for name, values in columns}
+            for row in rows
+        ]
@@ -0,0 +1,114 @@
+from rest_framework import serializers
+
+from recipes.models import Ingredient, Tag
+
+
+def split_param(request, name):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    return [item for item in value.split(',') if item]
+
+
+class FieldSelection:
+    """
+    Поля ответа, выбранные параметрами запроса.
+
+    fields — поля верхнего уровня, expand — связанные объекты, которые
+    возвращаются вложенными, остальные возвращаются только id.
+    Без параметров возвращаются все поля со вложенными объектами.
+    normalize=1 возвращает теги и ингредиенты по id, а сами объекты
+    один раз в словаре included; раскрывать их через expand вместе
+    с normalize нельзя.
+    """
+
+    def __init__(self, fields=None, expand=None, normalize=False):
+        self.fields = fields
+        self.expand = expand
+        self.normalize = normalize
+
+    @classmethod
+    def from_request(cls, request, available, relations, normalized=()):
+        fields = split_param(request, 'fields')
+        expand = split_param(request, 'expand')
+        normalize = bool(normalized) and request.query_params.get(
+            'normalize'
+        ) in ('1', 'true', 'True')
+        errors = {}
+        if fields is not None:
+            unknown = [name for name in fields if name not in available]
+            if unknown:
+                errors['fields'] = [f'Неизвестные поля: {unknown}.']
+        if expand is not None:
+            unknown = [name for name in expand if name not in relations]
+            conflicting = [name for name in expand if name in normalized]
+            if unknown:
+                errors['expand'] = [f'Неизвестные связи: {unknown}.']
+            elif normalize and conflicting:
+                errors['expand'] = [
+                    f'Связи {conflicting} при normalize=1 возвращаются '
+                    f'в included и не раскрываются.'
+                ]
+        if errors:
+            raise serializers.ValidationError(errors)
+        if normalize:
+            expand = [
+                name for name in (relations if expand is None else expand)
+                if name not in normalized
+            ]
+        return cls(fields, expand, normalize)
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return self.includes(name) and (
+            self.expand is None or name in self.expand
+        )
+
+
+class DynamicFieldsMixin:
+    """
+    Убирает из сериализатора поля, не выбранные в
+    context['field_selection'], и заменяет свернутые связи полями
+    из collapsed_fields.
+    """
+    collapsed_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.context.get('field_selection')
+        if selection is None:
+            return fields
+        for name in list(fields):
+            if not selection.includes(name):
+                del fields[name]
+            elif name in self.collapsed_fields and not selection.expands(
+                name
+            ):
+                fields[name] = self.collapsed_fields[name]()
+        return fields
+
+
+def included_objects(recipes):
+    """Теги и ингредиенты нормализованного списка рецептов по id."""
+    tag_ids = set()
+    ingredient_ids = set()
+    for recipe in recipes:
+        tag_ids.update(recipe.get('tags', []))
+        ingredient_ids.update(
+            item['id'] for item in recipe.get('ingredients', [])
+        )
+    return {
+        'tags': {
+            tag['id']: tag for tag in Tag.objects.filter(
+                pk__in=tag_ids
+            ).values('id', 'name', 'color', 'slug')
+        },
+        'ingredients': {
+            ingredient['id']: ingredient
+            for ingredient in Ingredient.objects.filter(
+                pk__in=ingredient_ids
+            ).values('id', 'name', 'measurement_unit')
+        },
+    }
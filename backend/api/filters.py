@@ -2,6 +2,7 @@ from django.contrib.auth import get_user_model
 from django_filters import rest_framework as filters
 from rest_framework.filters import SearchFilter
 
+from api.relations import user_relations
 from recipes.models import Recipe, Tag
 
 User = get_user_model()
@@ -27,6 +28,7 @@ class RecipeFilter(filters.FilterSet):
         label=('Теги'),
         field_name='tags__slug',
         to_field_name='slug',
+        method='filter_tags',
     )
 
     class Meta:
@@ -38,26 +40,31 @@ class RecipeFilter(filters.FilterSet):
             'tags',
         ]
 
-    def filter_is_favorited(self, queryset, field_name, value):
-        user = self.request.user
-        if not user or user.is_anonymous:
+    def filter_tags(self, queryset, field_name, value):
+        if not value:
             return queryset
-        if value:
-            return queryset.filter(favoriterecipe__user=user)
-        if value is False:
-            return queryset.excluse(favoriterecipe__user=user)
-        return queryset
+        return queryset.filter_tags(tag.pk for tag in value)
 
-    def filter_is_in_shopping_cart(self, queryset, field_name, value):
+    def filter_relation(self, queryset, recipe_ids, value):
         user = self.request.user
         if not user or user.is_anonymous:
             return queryset
         if value:
-            return queryset.filter(recipeinshoppingcart__user=user)
+            return queryset.filter(pk__in=recipe_ids)
         if value is False:
-            return queryset.excluse(recipeinshoppingcart__user=user)
+            return queryset.exclude(pk__in=recipe_ids)
         return queryset
 
+    def filter_is_favorited(self, queryset, field_name, value):
+        return self.filter_relation(
+            queryset, user_relations(self.request).favorites, value
+        )
+
+    def filter_is_in_shopping_cart(self, queryset, field_name, value):
+        return self.filter_relation(
+            queryset, user_relations(self.request).shopping_cart, value
+        )
+
 
 class IngredientFilter(SearchFilter):
     search_param = 'name'
@@ -0,0 +1,80 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.renderers import FastJSONRenderer
+from api.views import IngredientViewSet, RecipeViewSet
+
+User = get_user_model()
+
+ENDPOINTS = {
+    'recipes': (RecipeViewSet, '/api/recipes/'),
+    'ingredients': (IngredientViewSet, '/api/ingredients/'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает процессорное время на запрос для стандартной и быстрой '
+        'сериализации списков рецептов и ингредиентов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument(
+            '--user',
+            help='email пользователя, от имени которого выполнять запросы',
+        )
+
+    def run(self, endpoint, fast, renderer_class, options):
+        viewset, url = ENDPOINTS[endpoint]
+        view = viewset.as_view(
+            {'get': 'list'}, renderer_classes=[renderer_class]
+        )
+        factory = APIRequestFactory()
+        params = {'limit': options['limit']} if endpoint == 'recipes' else {}
+        user = None
+        if options['user']:
+            user = User.objects.get(email=options['user'])
+
+        content = b''
+        started = time.process_time()
+        # Снимок справочников отключен: сравнивается сериализация.
+        with override_settings(
+            API_FAST_SERIALIZATION=fast,
+            REFERENCE_DATA={**settings.REFERENCE_DATA, 'ENABLED': False},
+        ):
+            for _ in range(options['requests']):
+                request = factory.get(url, params)
+                if user is not None:
+                    force_authenticate(request, user=user)
+                response = view(request)
+                response.render()
+                content = response.content
+        elapsed = time.process_time() - started
+        return elapsed / options['requests'], content
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля.')
+        for endpoint in ENDPOINTS:
+            before, expected = self.run(endpoint, False, JSONRenderer, options)
+            after, content = self.run(
+                endpoint, True, FastJSONRenderer, options
+            )
+            self.stdout.write(
+                f'{endpoint}: {before * 1000:.2f} мс -> '
+                f'{after * 1000:.2f} мс CPU на запрос '
+                f'(x{before / after if after else 0:.1f})'
+            )
+            if content != expected:
+                raise CommandError(
+                    f'{endpoint}: ответы стандартной и быстрой '
+                    f'сериализации различаются.'
+                )
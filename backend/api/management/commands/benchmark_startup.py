@@ -0,0 +1,101 @@
+import os
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.encoding import iri_to_uri
+
+MODES = {
+    'cold': {'GUNICORN_PRELOAD': 'False'},
+    'warm': {'GUNICORN_PRELOAD': 'True'},
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fetch(url):
+    """Статус и время ответа в секундах."""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(iri_to_uri(url), timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        status = error.code
+    except (urllib.error.URLError, ConnectionError):
+        status = None
+    return status, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает запуск gunicorn без preload и с прогревом: время до '
+        'первого ответа и задержку первых запросов к воркерам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--timeout', type=float, default=60)
+
+    def run(self, mode, options):
+        port = free_port()
+        env = {
+            **os.environ,
+            **MODES[mode],
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+            'GUNICORN_WORKERS': str(options['workers']),
+        }
+        base_url = f'http://127.0.0.1:{port}'
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [
+                'gunicorn', '-c', 'gunicorn.conf.py',
+                'foodgram.wsgi:application',
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise CommandError(f'{mode}: gunicorn завершился.')
+                if time.perf_counter() - started > options['timeout']:
+                    raise CommandError(f'{mode}: gunicorn не ответил.')
+                status, _ = fetch(base_url + settings.WARMUP['URLS'][0])
+                if status == 200:
+                    break
+                time.sleep(0.05)
+            ready = time.perf_counter() - started
+            # Первые запросы после запуска: каждый воркер отвечает впервые.
+            latencies = sorted(
+                fetch(base_url + url)[1]
+                for _ in range(options['requests'])
+                for url in settings.WARMUP['URLS']
+            )
+        finally:
+            process.terminate()
+            process.wait()
+        return ready, latencies
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля.')
+        for mode in MODES:
+            ready, latencies = self.run(mode, options)
+            median = latencies[len(latencies) // 2]
+            self.stdout.write(
+                f'{mode}: первый ответ через {ready * 1000:.0f} мс, '
+                f'запросы после запуска: медиана {median * 1000:.1f} мс, '
+                f'максимум {latencies[-1] * 1000:.1f} мс'
+            )
@@ -0,0 +1,202 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from recipes.models import (
+    FavoriteRecipe, Recipe,
+    RecipeIngredient, RecipeInShoppingCart,
+    Subscription
+)
+
+User = get_user_model()
+
+PAGE_SIZE = 6
+
+INDEX_ONLY = 'index-only'
+INDEX = 'index'
+FULL_SCAN = 'full-scan'
+
+PLAN_PATTERNS = {
+    'sqlite': [
+        (re.compile(r'(?:SEARCH|SCAN) (\w+) USING COVERING INDEX'),
+         INDEX_ONLY),
+        (re.compile(
+            r'(?:SEARCH|SCAN) (\w+) USING (?:INTEGER PRIMARY KEY|INDEX)'
+        ), INDEX),
+        (re.compile(r'SCAN (\w+)\s*$'), FULL_SCAN),
+    ],
+    'postgresql': [
+        (re.compile(r'Index Only Scan (?:Backward )?using \w+ on (\w+)'),
+         INDEX_ONLY),
+        (re.compile(
+            r'(?:Index Scan (?:Backward )?using \w+|Bitmap Heap Scan) '
+            r'on (\w+)'
+        ), INDEX),
+        (re.compile(r'Seq Scan on (\w+)'), FULL_SCAN),
+    ],
+}
+
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY'),
+    'postgresql': re.compile(r'^\s*(?:->\s*)?(?:Incremental )?Sort\b', re.M),
+}
+
+
+def query_shapes(user_id, recipe_ids):
+    """
+    Запросы API в виде (название, queryset, допустима ли сортировка).
+
+    Сортировка без индекса допустима только там, где порядок задается
+    по полям другой таблицы, чем фильтр.
+    """
+    recipes = Recipe.objects.all()
+    return [
+        ('Список рецептов', recipes[:PAGE_SIZE], False),
+        (
+            'Рецепты автора',
+            recipes.filter(author_id=user_id)[:PAGE_SIZE],
+            False,
+        ),
+        (
+            'Рецепты по тегам',
+            recipes.filter_tags([1, 2])[:PAGE_SIZE],
+            False,
+        ),
+        (
+            'Избранные рецепты',
+            recipes.filter(favoriterecipe__user_id=user_id)[:PAGE_SIZE],
+            True,
+        ),
+        (
+            'Рецепты в корзине',
+            recipes.filter(
+                recipeinshoppingcart__user_id=user_id
+            )[:PAGE_SIZE],
+            True,
+        ),
+        (
+            'Ингредиенты рецептов',
+            RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).select_related('ingredient').order_by(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ),
+            True,
+        ),
+        (
+            'Теги рецептов',
+            Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values('recipe_id', 'tag_id'),
+            False,
+        ),
+        (
+            'Рецепт в избранном',
+            FavoriteRecipe.objects.filter(
+                user_id=user_id, recipe_id__in=recipe_ids
+            ).values('recipe_id'),
+            False,
+        ),
+        (
+            'Рецепт в корзине',
+            RecipeInShoppingCart.objects.filter(
+                user_id=user_id, recipe_id__in=recipe_ids
+            ).values('recipe_id'),
+            False,
+        ),
+        (
+            'Подписка на автора',
+            Subscription.objects.filter(
+                user_id=user_id, author_id__in=[user_id]
+            ).values('author_id'),
+            False,
+        ),
+        (
+            'Подписки пользователя',
+            User.objects.filter(subscribers__user_id=user_id)[:PAGE_SIZE],
+            True,
+        ),
+        (
+            'Список покупок',
+            RecipeIngredient.objects.filter(
+                recipe__recipeinshoppingcart__user_id=user_id
+            ).values(
+                'ingredient__name',
+                'ingredient__measurement_unit'
+            ).annotate(
+                total=Sum('amount')
+            ).order_by('ingredient__name', 'ingredient__measurement_unit'),
+            True,
+        ),
+    ]
+
+
+def analyze_plan(vendor, plan):
+    accesses = []
+    for line in plan.splitlines():
+        for pattern, access in PLAN_PATTERNS[vendor]:
+            match = pattern.search(line)
+            if match:
+                accesses.append((match.group(1), access))
+                break
+    return accesses
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для запросов API и показывает, какие из них '
+        'читают таблицы или сортируют результат без индексов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Завершиться с ошибкой, если запрос не использует индекс.',
+        )
+
+    def explain(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in PLAN_PATTERNS:
+            raise CommandError(f'СУБД {vendor} не поддерживается.')
+
+        user_id = User.objects.values_list('id', flat=True).first() or 1
+        recipe_ids = list(
+            Recipe.objects.values_list('id', flat=True)[:PAGE_SIZE]
+        ) or [1]
+
+        problems = []
+        shapes = query_shapes(user_id, recipe_ids)
+        for name, queryset, sort_allowed in shapes:
+            plan = self.explain(queryset)
+            accesses = analyze_plan(vendor, plan)
+            sorted_without_index = bool(SORT_PATTERNS[vendor].search(plan))
+            summary = ', '.join(
+                f'{table}: {access}' for table, access in accesses
+            )
+            if sorted_without_index:
+                summary += ', сортировка'
+            self.stdout.write(f'{name}: {summary}')
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+            problems.extend(
+                f'{name}: полное сканирование {table}'
+                for table, access in accesses if access == FULL_SCAN
+            )
+            if sorted_without_index and not sort_allowed:
+                problems.append(f'{name}: сортировка без индекса')
+
+        if problems and options['check']:
+            raise CommandError(
+                'Запросы без индексов: ' + '; '.join(problems)
+            )
@@ -0,0 +1,103 @@
+import random
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+from api.profiling import SamplingProfiler, save_profile, token_is_valid
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_br = _lazy_re_compile(r'\bbr\b')
+re_accepts_gzip = _lazy_re_compile(r'\bgzip\b')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжимает JSON-ответы API больше API_COMPRESSION_MIN_SIZE байт.
+
+    Brotli используется, если клиент его поддерживает и установлен пакет
+    brotli, иначе gzip.
+    """
+
+    def compress(self, encoding, content):
+        if encoding == 'br':
+            return brotli.compress(
+                content, quality=settings.API_COMPRESSION_BROTLI_QUALITY
+            )
+        return compress_string(content)
+
+    def get_encoding(self, request):
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_br.search(accept_encoding):
+            return 'br'
+        if re_accepts_gzip.search(accept_encoding):
+            return 'gzip'
+        return None
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if content_type not in settings.API_COMPRESSION_CONTENT_TYPES:
+            return response
+        if len(response.content) < settings.API_COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.get_encoding(request)
+        if encoding is None:
+            return response
+
+        compressed_content = self.compress(encoding, response.content)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запросы с подписанным заголовком PROFILING['HEADER'] и
+    долю PROFILING['SAMPLE_RATE'] остальных запросов.
+
+    При выключенном PROFILING['ENABLED'] Django не подключает middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        token = request.META.get(settings.PROFILING['HEADER'])
+        if token is not None:
+            return token_is_valid(token)
+        return random.random() < settings.PROFILING['SAMPLE_RATE']
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        profiler = SamplingProfiler(settings.PROFILING['INTERVAL'])
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        response['X-Profile-Id'] = save_profile(profiler, request, response)
+        return response
@@ -28,6 +28,14 @@ class IsAuthenticatedOrReadOnly(permissions.BasePermission):
         return False
 
 
+class IsStaff(permissions.BasePermission):
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+
+        return False
+
+
 class IsAuthor(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user and request.user == obj.author:
@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+PROFILE_ID_RE = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+TOKEN_SALT = 'api.profiling'
+TOKEN_VALUE = 'profile'
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик одного потока.
+
+    Отдельный поток каждые interval секунд снимает стек профилируемого
+    потока через sys._current_frames и считает одинаковые стеки.
+    Результат — свернутые стеки (collapsed stacks) для flame graph.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self.run, daemon=True)
+
+    @staticmethod
+    def frame_name(frame):
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        return f'{module}.{code.co_name}:{code.co_firstlineno}'
+
+    def sample(self):
+        frame = sys._current_frames().get(self._thread_id)
+        names = []
+        while frame is not None:
+            names.append(self.frame_name(frame))
+            frame = frame.f_back
+        if names:
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+        self.duration = time.perf_counter() - self.started_at
+
+
+def make_token():
+    """Значение заголовка, включающего профилирование запроса."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def token_is_valid(value):
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=settings.PROFILING['TOKEN_MAX_AGE']
+        ) == TOKEN_VALUE
+    except signing.BadSignature:
+        return False
+
+
+def profile_path(profile_id):
+    return os.path.join(settings.PROFILING['DIR'], f'{profile_id}.json')
+
+
+def save_profile(profiler, request, response):
+    """
+    Сохраняет профиль в каталог PROFILING['DIR'] и удаляет самые старые
+    профили сверх PROFILING['MAX_PROFILES']. Возвращает id профиля.
+    """
+    directory = settings.PROFILING['DIR']
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    profile = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'duration': profiler.duration,
+        'interval': profiler.interval,
+        'samples': sum(profiler.stacks.values()),
+        'stacks': dict(profiler.stacks),
+    }
+    path = profile_path(profile_id)
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(profile, file)
+    os.replace(f'{path}.tmp', path)
+
+    for stale_id in list_profile_ids()[settings.PROFILING['MAX_PROFILES']:]:
+        try:
+            os.remove(profile_path(stale_id))
+        except FileNotFoundError:
+            pass
+    return profile_id
+
+
+def list_profile_ids():
+    """id сохраненных профилей, новые первыми."""
+    try:
+        names = os.listdir(settings.PROFILING['DIR'])
+    except FileNotFoundError:
+        return []
+    ids = [
+        name[:-len('.json')] for name in names
+        if name.endswith('.json') and PROFILE_ID_RE.match(name[:-5])
+    ]
+    # id начинается со времени в наносекундах.
+    return sorted(ids, key=lambda pk: int(pk.split('-')[0]), reverse=True)
+
+
+def load_profile(profile_id):
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def collapsed_stacks(profile):
+    """Формат collapsed stacks для flamegraph.pl и speedscope."""
+    return ''.join(
+        f'{stack} {count}\n' for stack, count in profile['stacks'].items()
+    )
+
+
+def speedscope_profile(profile):
+    """Профиль в формате speedscope (sampled, вес в миллисекундах)."""
+    frames = {}
+    samples = []
+    for stack in profile['stacks']:
+        samples.append([
+            frames.setdefault(name, len(frames))
+            for name in stack.split(';')
+        ])
+    weights = [
+        count * profile['interval'] * 1000
+        for count in profile['stacks'].values()
+    ]
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': [{'name': name} for name in frames]},
+        'profiles': [{
+            'type': 'sampled',
+            'name': f'{profile["method"]} {profile["path"]}',
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
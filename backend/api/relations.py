@@ -0,0 +1,118 @@
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from api.caching import LRUCache
+from api.conditional import relations_version
+from recipes.models import FavoriteRecipe, RecipeInShoppingCart, Subscription
+
+VERSION_KEY = 'relations_version:{}'
+
+UserRelations = namedtuple(
+    'UserRelations', ['favorites', 'shopping_cart', 'subscriptions']
+)
+EMPTY_RELATIONS = UserRelations(frozenset(), frozenset(), frozenset())
+
+relations_cache = LRUCache(
+    maxsize=settings.RELATIONS_CACHE['MAXSIZE'],
+    ttl=settings.RELATIONS_CACHE['TTL'],
+)
+
+
+def get_version_cache():
+    alias = settings.RELATIONS_CACHE['VERSION_CACHE']
+    return caches[alias] if alias else None
+
+
+def bump_relations_version(user_ids):
+    """
+    Удаляет версии связей пользователей из общего кеша, следующий
+    запрос получит новую. Вызывается после фиксации транзакции, иначе
+    другой процесс успеет загрузить старые связи под новой версией.
+    """
+    version_cache = get_version_cache()
+    if version_cache is not None:
+        version_cache.delete_many([VERSION_KEY.format(pk) for pk in user_ids])
+
+
+def shared_relations_version(user):
+    """
+    Версия связей из общего кеша. Пропавшая версия заменяется новой
+    случайной, поэтому вытеснение ключа только сбрасывает снимки.
+    """
+    version_cache = get_version_cache()
+    if version_cache is None or not user or user.is_anonymous:
+        return relations_version(user)
+    key = VERSION_KEY.format(user.pk)
+    version = version_cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not version_cache.add(key, version, None):
+            version = version_cache.get(key) or version
+    return version
+
+
+def request_relations_version(request):
+    """
+    Версия связей пользователя запроса, одна на запрос: по ней строятся
+    и ETag, и снимок, поэтому ответ 304 не отдается по устаревшему
+    снимку. С общим кешем это одно чтение ключа, без него — запрос
+    к базе.
+    """
+    version = getattr(request, '_relations_version', None)
+    if version is None:
+        version = shared_relations_version(request.user)
+        request._relations_version = version
+    return version
+
+
+def bump_relations(request):
+    """Сбрасывает версию и снимок связей, сохраненные в запросе."""
+    request._relations_version = None
+    request._user_relations = None
+
+
+def load_relations(user):
+    return UserRelations(
+        *(
+            frozenset(model.objects.filter(user=user).values_list(
+                field, flat=True
+            ))
+            for model, field in [
+                (FavoriteRecipe, 'recipe_id'),
+                (RecipeInShoppingCart, 'recipe_id'),
+                (Subscription, 'author_id'),
+            ]
+        )
+    )
+
+
+def user_relations(request):
+    """
+    Избранное, корзина и подписки пользователя запроса в виде множеств id.
+
+    Снимок хранится в памяти процесса вместе с версией связей
+    и используется, пока версия не изменилась, в том числе после
+    изменений в другом процессе или в обход API.
+    """
+    if request is None:
+        return EMPTY_RELATIONS
+    user = request.user
+    if not user or user.is_anonymous:
+        return EMPTY_RELATIONS
+    relations = getattr(request, '_user_relations', None)
+    if relations is not None:
+        return relations
+    # Версия читается до загрузки: изменение во время загрузки изменит
+    # ее, и следующий запрос загрузит снимок заново.
+    version = request_relations_version(request)
+    cached = relations_cache.get(user.pk)
+    if cached is not None and cached[0] == version:
+        relations = cached[1]
+    else:
+        relations = load_relations(user)
+        relations_cache.set(user.pk, (version, relations))
+    request._user_relations = relations
+    return relations
@@ -1,15 +1,19 @@
 import base64
-import uuid
+import hashlib
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, prefetch_related_objects
 from djoser import serializers as dj_serializers
 from rest_framework import serializers
 
+from api.fast_serializers import ShortRecipeValuesSerializer
+from api.fields import DynamicFieldsMixin
+from api.relations import user_relations
 from recipes.models import (
-    FavoriteRecipe, Ingredient, Recipe,
-    RecipeIngredient, RecipeInShoppingCart,
-    Subscription, Tag
+    Ingredient, MealPlan, MealPlanEntry, Recipe, RecipeIngredient, Tag
 )
 
 User = get_user_model()
@@ -19,10 +23,13 @@ class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
-            file_name = str(uuid.uuid4())
+            content = base64.b64decode(imgstr)
+            # Имя из хеша содержимого: URL меняется только вместе с
+            # изображением, поэтому его можно кешировать навсегда.
+            file_name = hashlib.sha256(content).hexdigest()[:32]
             file_extension = format.split('/')[-1]
             data = ContentFile(
-                base64.b64decode(imgstr), name=file_name + '.' + file_extension
+                content, name=file_name + '.' + file_extension
             )
 
         return super().to_internal_value(data)
@@ -43,12 +50,9 @@ class UserSerializer(dj_serializers.UserSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        if not user or user.is_anonymous:
-            return False
-        queryset = Subscription.objects.all()
-        return queryset.filter(user=user, author=obj).exists()
+        return obj.pk in user_relations(
+            self.context.get('request')
+        ).subscriptions
 
 
 class UserCreateSerializer(dj_serializers.UserCreateSerializer):
@@ -102,7 +106,18 @@ class IngredientForRecipeSerializer(serializers.ModelSerializer):
         ]
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class CollapsedIngredientSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient_id')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = [
+            'id',
+            'amount',
+        ]
+
+
+class RecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientForRecipeSerializer(
@@ -116,6 +131,26 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     image = Base64ImageField()
 
+    prefetch_lookups = [
+        'tags',
+        Prefetch(
+            'recipeingredient_set',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient'
+            ).order_by('ingredient__name', 'ingredient__measurement_unit'),
+        ),
+    ]
+
+    collapsed_fields = {
+        'author': lambda: serializers.ReadOnlyField(source='author_id'),
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True
+        ),
+        'ingredients': lambda: CollapsedIngredientSerializer(
+            source='recipeingredient_set', many=True, read_only=True
+        ),
+    }
+
     class Meta:
         model = Recipe
         fields = [
@@ -131,23 +166,32 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time',
         ]
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, selection=None):
+        if selection is None:
+            return queryset.select_related('author').prefetch_related(
+                *cls.prefetch_lookups
+            )
+        if selection.expands('author'):
+            queryset = queryset.select_related('author')
+        if not selection.includes('text'):
+            queryset = queryset.defer('text')
+        tags_lookup, ingredients_lookup = cls.prefetch_lookups
+        if selection.includes('tags'):
+            queryset = queryset.prefetch_related(tags_lookup)
+        if selection.includes('ingredients'):
+            queryset = queryset.prefetch_related(ingredients_lookup)
+        return queryset
+
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        if not user or user.is_anonymous:
-            return False
-        return RecipeInShoppingCart.objects.filter(
-            recipe=obj,
-            user=user
-        ).exists()
+        return obj.pk in user_relations(
+            self.context.get('request')
+        ).shopping_cart
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        if not user or user.is_anonymous:
-            return False
-        queryset = FavoriteRecipe.objects.all()
-        return queryset.filter(recipe=obj, user=user).exists()
+        return obj.pk in user_relations(
+            self.context.get('request')
+        ).favorites
 
 
 class CreateIngredientForRecipeSerializer(serializers.ModelSerializer):
@@ -165,9 +209,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = CreateIngredientForRecipeSerializer(
         many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
     )
 
     image = Base64ImageField()
@@ -183,6 +226,27 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time',
         ]
 
+    @staticmethod
+    def check_ids(ids, existing_ids, name):
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(f'{name} не должны повторяться.')
+        missing = [pk for pk in ids if pk not in existing_ids]
+        if missing:
+            raise serializers.ValidationError(f'{name} не найдены: {missing}.')
+
+    def validate_tags(self, value):
+        tags = Tag.objects.in_bulk(value)
+        self.check_ids(value, tags, 'Теги')
+        return [tags[pk] for pk in value]
+
+    def validate_ingredients(self, value):
+        ids = [item['ingredient']['id'] for item in value]
+        existing_ids = set(
+            Ingredient.objects.filter(pk__in=ids).values_list('id', flat=True)
+        )
+        self.check_ids(ids, existing_ids, 'Ингредиенты')
+        return value
+
     def create_related_ingredients(self, recipe, ingredients_data):
         recipe_ingredients = []
         for ingredient_data in ingredients_data:
@@ -194,6 +258,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             recipe_ingredients.append(recipe_ingredient)
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
@@ -205,6 +270,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
         return instance
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         RecipeIngredient.objects.filter(recipe=instance).delete()
 
@@ -219,6 +285,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance], *RecipeSerializer.prefetch_lookups
+        )
         return RecipeSerializer(
             instance, context={'request': self.context.get('request')}
         ).data
@@ -235,11 +304,29 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         ]
 
 
-class UserWithRecipesSerializer(serializers.ModelSerializer):
+class RelationBatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RELATION_BATCH_MAX_SIZE,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class UserWithRecipesSerializer(DynamicFieldsMixin,
+                                serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
+    collapsed_fields = {
+        'recipes': lambda: serializers.SerializerMethodField(
+            'get_recipe_ids'
+        ),
+    }
+
     class Meta:
         model = User
         fields = [
@@ -253,21 +340,157 @@ class UserWithRecipesSerializer(serializers.ModelSerializer):
             'recipes_count',
         ]
 
+    @staticmethod
+    def get_recipes_limit(request):
+        """Значение recipes_limit, 0 и пустое значение — без ограничения."""
+        value = request.query_params.get('recipes_limit') if request else None
+        if not value:
+            return None
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise serializers.ValidationError({
+                'recipes_limit': ['Должно быть неотрицательным целым числом.']
+            })
+        return limit or None
+
+    @staticmethod
+    def recipes_prefetch(limit, authors):
+        """
+        Последние limit рецептов каждого автора одним запросом.
+        Нумеруются только рецепты authors, а не вся таблица.
+        """
+        recipes = Recipe.objects.filter(author__in=authors).only(
+            'id', 'author_id', 'name', 'image', 'cooking_time', 'pub_date'
+        ).order_by('-pub_date', '-id')
+        if limit is not None:
+            recipes = recipes.latest_per_author(limit)
+        return Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, request):
+        return queryset.annotate(
+            recipes_total=Count('recipes', distinct=True)
+        ).prefetch_related(
+            cls.recipes_prefetch(cls.get_recipes_limit(request), queryset)
+        )
+
+    def limited_recipes(self, obj):
+        if not hasattr(obj, 'limited_recipes'):
+            prefetch_related_objects([obj], self.recipes_prefetch(
+                self.get_recipes_limit(self.context.get('request')),
+                [obj.pk],
+            ))
+        return obj.limited_recipes
+
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        if not user or user.is_anonymous:
-            return False
-        queryset = Subscription.objects.all()
-        return queryset.filter(user=user, author=obj).exists()
+        return obj.pk in user_relations(
+            self.context.get('request')
+        ).subscriptions
+
+    def get_recipe_ids(self, obj):
+        return [recipe.id for recipe in self.limited_recipes(obj)]
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj)
-        if limit:
-            queryset = queryset[: int(limit)]
-        return ShortRecipeSerializer(queryset, many=True).data
+        recipes = self.limited_recipes(obj)
+        if settings.API_FAST_SERIALIZATION:
+            return ShortRecipeValuesSerializer(
+                [
+                    {
+                        'id': recipe.id,
+                        'name': recipe.name,
+                        'image': recipe.image.name,
+                        'cooking_time': recipe.cooking_time,
+                    }
+                    for recipe in recipes
+                ],
+                many=True,
+            ).data
+        return ShortRecipeSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_total'):
+            return obj.recipes_total
         return Recipe.objects.filter(author=obj).count()
+
+
+class MealPlanEntrySerializer(serializers.ModelSerializer):
+    recipe = serializers.IntegerField(source='recipe_id', min_value=1)
+
+    class Meta:
+        model = MealPlanEntry
+        fields = [
+            'recipe',
+            'date',
+            'servings',
+        ]
+
+
+class MealPlanSerializer(serializers.ModelSerializer):
+    entries = MealPlanEntrySerializer(many=True)
+
+    class Meta:
+        model = MealPlan
+        fields = [
+            'id',
+            'name',
+            'start_date',
+            'version',
+            'entries',
+        ]
+        read_only_fields = ['version']
+
+    def validate_entries(self, value):
+        ids = list({item['recipe_id'] for item in value})
+        existing_ids = set(
+            Recipe.objects.filter(pk__in=ids).values_list('id', flat=True)
+        )
+        missing = [pk for pk in ids if pk not in existing_ids]
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {missing}.'
+            )
+        return value
+
+    def validate(self, data):
+        start_date = data.get(
+            'start_date', getattr(self.instance, 'start_date', None)
+        )
+        if any(item['date'] < start_date for item in data.get('entries', [])):
+            raise serializers.ValidationError(
+                {'entries': 'День не может быть раньше начала плана.'}
+            )
+        return data
+
+    def create_entries(self, plan, entries_data):
+        MealPlanEntry.objects.bulk_create(
+            MealPlanEntry(plan=plan, **entry_data)
+            for entry_data in entries_data
+        )
+
+    @transaction.atomic
+    def create(self, validated_data):
+        entries_data = validated_data.pop('entries')
+
+        instance = super().create(validated_data)
+
+        self.create_entries(instance, entries_data)
+
+        return instance
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        entries_data = validated_data.pop('entries', None)
+
+        # Новая версия плана делает недействительным кеш списка покупок.
+        validated_data['version'] = F('version') + 1
+        instance = super().update(instance, validated_data)
+        instance.refresh_from_db(fields=['version'])
+
+        if entries_data is not None:
+            MealPlanEntry.objects.filter(plan=instance).delete()
+            self.create_entries(instance, entries_data)
+
+        return instance
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.relations import bump_relations_version
+from recipes.models import (
+    FavoriteRecipe, RecipeInShoppingCart, Subscription, relations_changed
+)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # После удаления Django обнуляет pk, то есть key экземпляра.
+    keys = [instance.key]
+    transaction.on_commit(lambda: invalidate_tokens(keys))
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    token = getattr(request, 'auth', None)
+    if isinstance(token, Token):
+        keys = [token.key]
+        transaction.on_commit(lambda: invalidate_tokens(keys))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+    keys = list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    transaction.on_commit(lambda: invalidate_tokens(keys))
+
+
+@receiver(relations_changed)
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=RecipeInShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=RecipeInShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def relations_changed_handler(sender, instance=None, user_id=None, **kwargs):
+    user_ids = [user_id if instance is None else instance.user_id]
+    transaction.on_commit(lambda: bump_relations_version(user_ids))
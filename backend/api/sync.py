@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from recipes.models import FavoriteRecipe, RecipeInShoppingCart, Tombstone
+
+CURSOR_SALT = 'api.sync.cursor'
+
+
+def make_cursor(changed_since, recipe):
+    """
+    Курсор следующей страницы: исходный changed_since клиента и
+    позиция (updated_at, id) последнего отданного рецепта.
+    """
+    return signing.dumps(
+        [
+            changed_since and changed_since.isoformat(),
+            recipe.updated_at.isoformat(),
+            recipe.id,
+        ],
+        salt=CURSOR_SALT,
+    )
+
+
+class SyncParamsSerializer(serializers.Serializer):
+    changed_since = serializers.DateTimeField(required=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=settings.SYNC_MAX_LIMIT,
+        default=settings.SYNC_DEFAULT_LIMIT,
+    )
+
+    def validate_changed_since(self, value):
+        retention = timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        if value < timezone.now() - retention:
+            raise serializers.ValidationError(
+                'Дата старше срока хранения удалений, '
+                'выполните полную синхронизацию.'
+            )
+        return value
+
+    def validate_cursor(self, value):
+        # Срок хранения удалений проверяется только для changed_since
+        # первой страницы: граница страницы может быть сколь угодно старой.
+        try:
+            changed_since, updated_at, recipe_id = signing.loads(
+                value, salt=CURSOR_SALT
+            )
+        except (signing.BadSignature, TypeError, ValueError):
+            raise serializers.ValidationError('Некорректный курсор.')
+        return {
+            'changed_since': changed_since and parse_datetime(changed_since),
+            'position': (parse_datetime(updated_at), recipe_id),
+        }
+
+    def validate(self, attrs):
+        if 'cursor' in attrs and 'changed_since' in attrs:
+            raise serializers.ValidationError(
+                'Передайте либо changed_since, либо cursor.'
+            )
+        cursor = attrs.pop('cursor', None)
+        if cursor is not None:
+            attrs.update(cursor)
+        return attrs
+
+
+def changed_recipes(queryset, changed_since, position, limit):
+    """
+    Измененные рецепты в порядке (updated_at, id) после position.
+
+    Возвращает страницу рецептов и курсор следующей страницы или None.
+    """
+    queryset = queryset.order_by('updated_at', 'id')
+    if position is not None:
+        updated_at, recipe_id = position
+        queryset = queryset.filter(
+            Q(updated_at__gt=updated_at)
+            | Q(updated_at=updated_at, id__gt=recipe_id)
+        )
+    elif changed_since is not None:
+        queryset = queryset.filter(updated_at__gte=changed_since)
+    recipes = list(queryset[:limit + 1])
+    if len(recipes) <= limit:
+        return recipes, None
+    recipes = recipes[:limit]
+    return recipes, {'cursor': make_cursor(changed_since, recipes[-1])}
+
+
+def deleted_ids(kind, changed_since, user=None):
+    queryset = Tombstone.objects.filter(kind=kind, user=user)
+    if changed_since is not None:
+        queryset = queryset.filter(deleted_at__gt=changed_since)
+    return set(queryset.values_list('recipe_id', flat=True))
+
+
+def relation_changes(model, kind, user, changed_since):
+    relations = model.objects.filter(user=user)
+    changed = relations
+    if changed_since is not None:
+        changed = relations.filter(updated_at__gt=changed_since)
+    deleted = deleted_ids(kind, changed_since, user)
+    if deleted:
+        deleted.difference_update(relations.filter(
+            recipe_id__in=deleted
+        ).values_list('recipe_id', flat=True))
+    return {
+        'changed': sorted(changed.values_list('recipe_id', flat=True)),
+        'deleted': sorted(deleted),
+    }
+
+
+def user_changes(user, changed_since):
+    if not user or user.is_anonymous:
+        return {}
+    return {
+        'favorites': relation_changes(
+            FavoriteRecipe, Tombstone.FAVORITE, user, changed_since
+        ),
+        'shopping_cart': relation_changes(
+            RecipeInShoppingCart,
+            Tombstone.SHOPPING_CART,
+            user,
+            changed_since,
+        ),
+    }
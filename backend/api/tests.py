@@ -0,0 +1,667 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.authentication import CachedTokenAuthentication
+from api.events import request_params, ticket_user
+from api.relations import shared_relations_version
+from api.serializers import RecipeCreateSerializer
+from api.throttling import TokenBucketThrottle
+from recipes.models import (
+    FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
+    RecipeInShoppingCart, Subscription, Tag
+)
+
+User = get_user_model()
+
+
+class SubscriptionsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        for index in range(3):
+            author = User.objects.create_user(
+                email=f'author{index}@example.com',
+                username=f'author{index}',
+                password='pass12345XX',
+            )
+            for number in range(index + 2):
+                Recipe.objects.create(
+                    author=author,
+                    name=f'Рецепт {number}',
+                    text='Текст',
+                    cooking_time=10,
+                )
+            Subscription.objects.add(cls.user, author.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        for author in response.json()['results']:
+            expected = list(Recipe.objects.filter(
+                author_id=author['id']
+            ).order_by('-pub_date', '-id').values_list('id', flat=True))
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']], expected[:2]
+            )
+            self.assertEqual(author['recipes_count'], len(expected))
+
+    def test_queries_do_not_depend_on_authors(self):
+        self.client.get('/api/users/subscriptions/')
+        # Снимок связей уже в памяти, проверяется только его версия;
+        # остальное — страница, счетчик пагинации и рецепты всех авторов
+        # одним запросом.
+        with self.assertNumQueries(4):
+            self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 1}
+            )
+
+    def test_invalid_recipes_limit(self):
+        for value in ['abc', '-1']:
+            response = self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': value}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_subscribe_with_same_pub_date(self):
+        author = User.objects.create_user(
+            email='new@example.com', username='new', password='pass12345XX'
+        )
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10,
+            )
+            for number in range(3)
+        ]
+        Recipe.objects.filter(author=author).update(pub_date=timezone.now())
+        response = self.client.post(
+            f'/api/users/{author.pk}/subscribe/?recipes_limit=2'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['recipes']],
+            [recipes[2].pk, recipes[1].pk],
+        )
+
+
+class RelationsSnapshotTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_change_outside_api(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        response = self.client.get(url)
+        self.assertFalse(response.json()['is_favorited'])
+
+        # Изменение в обход API, как из админки или другого процесса.
+        FavoriteRecipe.objects.add(self.user, self.recipe.pk)
+
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorited'])
+
+
+@override_settings(RELATIONS_CACHE={
+    **settings.RELATIONS_CACHE, 'VERSION_CACHE': 'default'
+})
+class SharedRelationsVersionTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def assertVersionChanged(self, change):
+        version = shared_relations_version(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(shared_relations_version(self.user), version)
+
+    def test_version_without_queries(self):
+        version = shared_relations_version(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(shared_relations_version(self.user), version)
+
+    def test_manager_changes(self):
+        self.assertVersionChanged(
+            lambda: FavoriteRecipe.objects.add(self.user, self.recipe.pk)
+        )
+        self.assertVersionChanged(
+            lambda: FavoriteRecipe.objects.remove(self.user, self.recipe.pk)
+        )
+        self.assertVersionChanged(
+            lambda: RecipeInShoppingCart.objects.add_many(
+                self.user, [self.recipe.pk]
+            )
+        )
+
+    def test_model_changes(self):
+        self.assertVersionChanged(
+            lambda: FavoriteRecipe.objects.create(
+                user=self.user, recipe=self.recipe
+            )
+        )
+        self.assertVersionChanged(
+            lambda: Recipe.objects.filter(pk=self.recipe.pk).delete()
+        )
+
+    def test_change_outside_api(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        response = self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteRecipe.objects.add(self.user, self.recipe.pk)
+
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_favorited'])
+
+
+class ShoppingCartClearTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, name='Рецепт', text='Текст', cooking_time=10
+            )
+            for _ in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        RecipeInShoppingCart.objects.add_many(
+            self.user, [recipe.pk for recipe in self.recipes]
+        )
+
+    def cart(self):
+        return set(RecipeInShoppingCart.objects.filter(
+            user=self.user
+        ).values_list('recipe_id', flat=True))
+
+    def test_download_keeps_cart(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'clear': 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.cart()), 3)
+
+    def test_clear_downloaded_ids(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        response = self.client.post(
+            '/api/recipes/shopping_cart/clear/',
+            {'ids': [first, second]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.cart(), {third})
+
+    def test_clear_all(self):
+        response = self.client.post('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.cart(), set())
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_and_refill(self):
+        cache = caches['default']
+        cache.clear()
+        update = TokenBucketThrottle.update
+        waits = [update(cache, 'bucket', 100.0, 1.0, 2.0) for _ in range(4)]
+        self.assertEqual(waits, [0, 0, 0, 1.0])
+        self.assertEqual(update(cache, 'bucket', 101.0, 1.0, 2.0), 0)
+
+
+class ReferenceDataTests(APITestCase):
+    def test_bulk_changes_are_visible(self):
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        response = self.client.get('/api/ingredients/', {'name': 'м'})
+        self.assertEqual(len(response.json()), 1)
+
+        # bulk_create не отправляет сигналов.
+        Ingredient.objects.bulk_create([
+            Ingredient(name='молоко', measurement_unit='мл')
+        ])
+        response = self.client.get('/api/ingredients/', {'name': 'м'})
+        self.assertEqual(
+            [row['name'] for row in response.json()], ['молоко', 'мука']
+        )
+
+
+class SyncTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        for number in range(5):
+            Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {number}',
+                text='Текст',
+                cooking_time=10,
+            )
+        # Строки старше срока хранения удалений, как после миграции.
+        Recipe.objects.update(updated_at=timezone.now() - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS + 5
+        ))
+
+    def sync_all(self, params):
+        ids, deleted = [], []
+        while True:
+            response = self.client.get('/api/recipes/sync/', params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids += [recipe['id'] for recipe in data['recipes']['changed']]
+            deleted.append(data['recipes']['deleted'])
+            if data['next'] is None:
+                return ids, deleted
+            params = {**data['next'], 'limit': params['limit']}
+
+    def test_full_sync_of_old_rows(self):
+        ids, _ = self.sync_all({'limit': 2})
+        self.assertEqual(
+            ids, list(Recipe.objects.order_by('id').values_list(
+                'id', flat=True
+            ))
+        )
+
+    def test_pages_keep_changed_since(self):
+        since = timezone.now()
+        recipe, *changed = Recipe.objects.order_by('id')[:3]
+        Recipe.objects.filter(
+            pk__in=[other.pk for other in changed]
+        ).update(updated_at=timezone.now())
+        recipe_id = recipe.pk
+        recipe.delete()
+
+        ids, deleted = self.sync_all(
+            {'changed_since': since.isoformat(), 'limit': 1}
+        )
+
+        self.assertEqual(ids, [other.pk for other in changed])
+        self.assertEqual(deleted, [[recipe_id]] * 2)
+
+    def test_bad_cursor(self):
+        response = self.client.get('/api/recipes/sync/', {'cursor': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AUTH_TOKEN_CACHE={
+    **settings.AUTH_TOKEN_CACHE, 'SHARED_CACHE': 'default'
+})
+class TokenCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def test_logout_rejects_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_stale_entry_is_not_cached_after_revocation(self):
+        key = self.token.key
+        # Другой процесс прочитал токен из базы до отзыва.
+        stale = CachedTokenAuthentication().authenticate_credentials(key)
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        CachedTokenAuthentication().set_cached(key, stale)
+
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+
+class EventsTicketTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+
+    def test_ticket_requires_token(self):
+        response = self.client.post('/api/users/events_ticket/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_ticket_identifies_user(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/users/events_ticket/')
+        self.assertEqual(response.status_code, 201)
+        ticket = response.data['ticket']
+
+        self.assertEqual(ticket_user(ticket), self.user)
+        self.assertIsNone(ticket_user(ticket + 'x'))
+        with override_settings(EVENTS={
+            **settings.EVENTS, 'TICKET_TTL': -1
+        }):
+            self.assertIsNone(ticket_user(ticket))
+
+    def test_token_in_query_string_is_ignored(self):
+        token = Token.objects.create(user=self.user)
+        scope = {
+            'headers': [],
+            'query_string': f'token={token.key}&ticket=abc'.encode(),
+        }
+        self.assertEqual(request_params(scope), (None, 'abc', None))
+
+        scope['headers'] = [(b'authorization', f'Token {token}'.encode())]
+        self.assertEqual(request_params(scope), (token.key, 'abc', None))
+
+
+class RecipeTagsMaskTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='pass12345XX',
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}',
+                slug=f'tag{index}',
+            )
+            for index in range(3)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст', cooking_time=10
+        )
+
+    def update_tags(self, recipe, tags):
+        RecipeCreateSerializer().update(recipe, {
+            'ingredients': [], 'tags': tags
+        })
+
+    def assertTagged(self, tags):
+        for tag in self.tags:
+            self.assertEqual(
+                Recipe.objects.filter_tags([tag.pk]).exists(), tag in tags
+            )
+
+    def test_set_remove_and_clear(self):
+        first, second, third = self.tags
+        self.update_tags(self.recipe, [first, second])
+        self.assertTagged([first, second])
+        self.update_tags(self.recipe, [second, third])
+        self.assertTagged([second, third])
+        self.update_tags(self.recipe, [])
+        self.assertTagged([])
+
+    def test_stale_instance(self):
+        first, second, third = self.tags
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.get(pk=self.recipe.pk).tags.add(first)
+        stale.tags.add(second)
+        self.assertTagged([first, second])
+        self.update_tags(stale, [third])
+        self.assertTagged([third])
+        self.assertEqual(
+            stale.tags_mask, Recipe.objects.get(pk=stale.pk).tags_mask
+        )
+
+
+class FastSerializationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='pass12345XX',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {index}', color=f'#00000{index}',
+                slug=f'tag{index}',
+            )
+            for index in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(3)
+        ]
+        for number in range(4):
+            recipe = Recipe.objects.create(
+                author=author if number % 2 else cls.user,
+                name=f'Рецепт "{number}" — ёлка',
+                text='Текст\nс переводом строки',
+                cooking_time=number + 1,
+                image=f'recipes/images/{number}.png',
+            )
+            recipe.tags.set(tags[:number % 2 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=number + 10
+                )
+                for ingredient in ingredients[:number + 1]
+            )
+            if number % 2:
+                FavoriteRecipe.objects.add(cls.user, recipe.pk)
+            else:
+                RecipeInShoppingCart.objects.add(cls.user, recipe.pk)
+        Subscription.objects.add(cls.user, author.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def assertSameContent(self, url, params=None):
+        contents = []
+        for fast in (False, True):
+            with override_settings(API_FAST_SERIALIZATION=fast):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            contents.append(response.content)
+        self.assertEqual(contents[0], contents[1])
+
+    def test_recipes(self):
+        self.assertSameContent('/api/recipes/')
+        self.assertSameContent('/api/recipes/', {'is_favorited': 1})
+        self.assertSameContent('/api/recipes/', {
+            'fields': 'id,name,tags,ingredients', 'normalize': 1
+        })
+        self.client.force_authenticate(None)
+        self.assertSameContent('/api/recipes/')
+
+    def test_subscriptions(self):
+        self.assertSameContent(
+            '/api/users/subscriptions/', {'recipes_limit': 1}
+        )
+
+    @override_settings(REFERENCE_DATA={'ENABLED': False})
+    def test_ingredients(self):
+        self.assertSameContent('/api/ingredients/')
+        self.assertSameContent('/api/ingredients/', {'name': 'ингр'})
+
+
+class ConditionalRequestsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_recipe_change(self):
+        for url in ['/api/recipes/', f'/api/recipes/{self.recipe.pk}/']:
+            etag = self.assertNotModified(url)
+            self.recipe.save()
+            self.assertModified(url, etag)
+
+    def test_relations_change(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.assertNotModified(url)
+        response = self.client.post(f'{url}favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertModified(url, etag)
+
+    def test_etag_depends_on_user(self):
+        url = '/api/recipes/'
+        etag = self.assertNotModified(url)
+        self.client.force_authenticate(None)
+        self.assertModified(url, etag)
+
+    def test_new_recipe_in_list(self):
+        url = '/api/recipes/'
+        etag = self.assertNotModified(url)
+        Recipe.objects.create(
+            author=self.user, name='Новый', text='Текст', cooking_time=5
+        )
+        self.assertModified(url, etag)
+
+
+class ProfilesTests(APITestCase):
+    profile_id = '1700000000000000000-0123abcd'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.staff = User.objects.create_user(
+            email='staff@example.com', username='staff',
+            password='pass12345XX', is_staff=True,
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILING={
+            **settings.PROFILING, 'DIR': directory.name
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        with open(
+            os.path.join(directory.name, f'{self.profile_id}.json'), 'w'
+        ) as file:
+            json.dump({
+                'id': self.profile_id,
+                'method': 'GET',
+                'path': '/api/recipes/',
+                'status': 200,
+                'duration': 0.01,
+                'interval': 0.005,
+                'samples': 2,
+                'stacks': {'a;b': 2},
+            }, file)
+        # Файл вне каталога профилей.
+        with open(os.path.join(directory.name, 'secret.json'), 'w') as file:
+            file.write('{}')
+
+    def test_staff_only(self):
+        urls = ['/api/profiles/', f'/api/profiles/{self.profile_id}/']
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(
+            self.client.post('/api/profiles/token/').status_code, 401
+        )
+        self.client.force_authenticate(self.user)
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(
+            self.client.post('/api/profiles/token/').status_code, 403
+        )
+
+    def test_staff(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/profiles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [profile['id'] for profile in response.json()],
+            [self.profile_id],
+        )
+        self.assertNotIn('stacks', response.json()[0])
+
+        response = self.client.get(f'/api/profiles/{self.profile_id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'a;b 2\n')
+
+    def test_bad_ids(self):
+        self.client.force_authenticate(self.staff)
+        for profile_id in [
+            'secret',
+            '..%2Fsecret',
+            '1700000000000000000-0123ABCD',
+            '1700000000000000000-0123abc',
+            '1700000000000000001-0123abcd',
+        ]:
+            response = self.client.get(f'/api/profiles/{profile_id}/')
+            self.assertEqual(response.status_code, 404, profile_id)
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+try:
+    from django_redis.cache import RedisCache
+except ImportError:
+    RedisCache = None
+
+THROTTLE_CACHE_KEY = 'throttle:{}:{}'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Проверка и запись GCRA одним вызовом в Redis. Числа возвращаются
+# строками: Redis отбрасывает дробную часть чисел из Lua.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tolerance = tonumber(ARGV[3])
+local full_at = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+if full_at - now > tolerance then
+    return tostring(full_at - now - tolerance)
+end
+full_at = full_at + interval
+redis.call(
+    'SET', KEYS[1], tostring(full_at),
+    'PX', math.ceil((full_at - now) * 1000) + 1000
+)
+return '0'
+"""
+
+# Для остальных бэкендов чтение и запись атомарны только в процессе.
+lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """'60/min' -> (60, 60): число запросов и период в секундах."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket на клиента в кеше THROTTLING['CACHE'].
+
+    Корзина вмещает BURST запросов и пополняется со скоростью RATE.
+    Хранится одно число — момент, когда корзина снова станет полной
+    (алгоритм GCRA). В Redis (django-redis) проверка и запись
+    выполняются одним Lua-скриптом и атомарны для всех воркеров.
+    """
+    scope = None
+
+    def get_scope(self, request):
+        return self.scope
+
+    def get_client(self, request):
+        user = request.user
+        if user and user.is_authenticated:
+            return f'user:{user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request)
+        bucket = settings.THROTTLING['BUCKETS'][scope]
+        count, period = parse_rate(bucket['RATE'])
+        interval = period / count
+        tolerance = interval * (bucket['BURST'] - 1)
+
+        cache = caches[settings.THROTTLING['CACHE']]
+        key = THROTTLE_CACHE_KEY.format(scope, self.get_client(request))
+        self.wait_seconds = self.update(
+            cache, key, self.timer(), interval, tolerance
+        )
+        return not self.wait_seconds
+
+    @staticmethod
+    def update(cache, key, now, interval, tolerance):
+        """Занимает место в корзине. Возвращает 0 или время ожидания."""
+        if RedisCache is not None and isinstance(cache, RedisCache):
+            client = cache.client.get_client(write=True)
+            return float(client.register_script(GCRA_SCRIPT)(
+                keys=[cache.make_key(key)], args=[now, interval, tolerance]
+            ))
+        with lock:
+            full_at = max(cache.get(key, now), now)
+            if full_at - now > tolerance:
+                return full_at - now - tolerance
+            full_at += interval
+            cache.set(key, full_at, int(full_at - now) + 1)
+        return 0
+
+    def timer(self):
+        return time.time()
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ClientThrottle(TokenBucketThrottle):
+    """Общий лимит клиента: user для пользователей, anon по IP."""
+
+    def get_scope(self, request):
+        if request.user and request.user.is_authenticated:
+            return 'user'
+        return 'anon'
+
+
+class WriteThrottle(TokenBucketThrottle):
+    scope = 'write'
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        return super().allow_request(request, view)
+
+
+class ExportThrottle(TokenBucketThrottle):
+    scope = 'export'
+
+
+class SearchThrottle(TokenBucketThrottle):
+    scope = 'search'
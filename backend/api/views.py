@@ -1,51 +1,134 @@
+import json
 import logging
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views as dj_views
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from api.conditional import make_etag, recipe_version, recipes_version
+from api.events import make_ticket, publish_recipe_created
+from api.facets import facets_requested, recipe_facets
+from api.fast_serializers import (
+    IngredientValuesSerializer, RecipeValuesSerializer
+)
+from api.fields import FieldSelection, included_objects
 from api.filters import IngredientFilter, RecipeFilter
 from api.pagination import PageLimitPagination
 from api.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
-    IsAuthorOrReadOnly)
+    IsAuthorOrReadOnly,
+    IsStaff)
+from api.profiling import (
+    collapsed_stacks, list_profile_ids, load_profile,
+    make_token, speedscope_profile
+)
+from api.relations import bump_relations, request_relations_version
 from api.serializers import (
-    IngredientSerializer, RecipeCreateSerializer,
-    RecipeSerializer, ShortRecipeSerializer,
+    IngredientSerializer, MealPlanSerializer, RecipeCreateSerializer,
+    RecipeSerializer, RelationBatchSerializer, ShortRecipeSerializer,
     TagSerializer, UserWithRecipesSerializer
 )
+from api.sync import (
+    SyncParamsSerializer, changed_recipes, deleted_ids, user_changes
+)
+from api.throttling import ExportThrottle, SearchThrottle
+from recipes.meal_plans import bump_plans_with_recipe, shopping_list
 from recipes.models import (
-    FavoriteRecipe, Ingredient, Recipe,
-    RecipeIngredient, RecipeInShoppingCart,
-    Subscription, Tag
+    FavoriteRecipe, Ingredient, MealPlan, Recipe,
+    RecipeIngredient, RecipeInShoppingCart, Recommendation,
+    SimilarRecipe, Subscription, Tag, Tombstone
 )
+from recipes.outbox import enqueue
+from recipes.reference import reference_data
 
 User = get_user_model()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+POPULAR_CACHE_KEY = 'popular_recipes'
+
+
+def parse_pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+def popular_recipe_ids():
+    """Рецепты, чаще всего добавляемые в избранное."""
+    ids = cache.get(POPULAR_CACHE_KEY)
+    if ids is None:
+        ids = list(Recipe.objects.annotate(
+            favorites=Count('favoriterecipe')
+        ).order_by('-favorites', '-pub_date').values_list(
+            'id', flat=True
+        )[:settings.RECOMMENDATIONS['COUNT']])
+        cache.set(
+            POPULAR_CACHE_KEY,
+            ids,
+            settings.RECOMMENDATIONS['POPULAR_CACHE_TTL'],
+        )
+    return ids
+
+
+def fetch_batch(queryset, ids):
+    """
+    Объекты с переданными id в порядке запроса и ответ с ошибкой,
+    если часть объектов не найдена.
+    """
+    objects = queryset.in_bulk(ids)
+    missing = [pk for pk in ids if pk not in objects]
+    if missing:
+        return None, Response(
+            {'ids': [f'Объекты не найдены: {missing}.']},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return [objects[pk] for pk in ids], None
+
 
 class UserViewSet(dj_views.UserViewSet):
     pagination_class = PageLimitPagination
     pagination_class.page_size = 6
 
+    def get_throttles(self):
+        throttles = super().get_throttles()
+        if self.action == 'list':
+            throttles.append(SearchThrottle())
+        return throttles
+
     @action(
         detail=False,
         url_path='subscriptions',
         permission_classes=[IsAuthenticated],
     )
     def subscriptions(self, request):
-        subscriptions = User.objects.filter(subscribers__user=request.user)
+        subscriptions = UserWithRecipesSerializer.setup_eager_loading(
+            User.objects.filter(subscribers__user=request.user), request
+        ).order_by('id')
+        context = {
+            'request': request,
+            'field_selection': FieldSelection.from_request(
+                request,
+                UserWithRecipesSerializer.Meta.fields,
+                UserWithRecipesSerializer.collapsed_fields,
+            ),
+        }
         pages = self.paginate_queryset(subscriptions)
-        context = {'request': request}
         serializer = UserWithRecipesSerializer(
             pages,
             many=True,
@@ -55,27 +138,23 @@ class UserViewSet(dj_views.UserViewSet):
 
     @staticmethod
     def create_relation_author_with_user(model, author, user, request):
-        try:
-            instance = model.objects.create(author=author, user=user)
-        except Exception as ex:
-            logger.debug(f'Ошибка: {ex}')
+        if author == user or not model.objects.add(user, author.pk):
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        bump_relations(request)
         context = {'request': request}
         serializer = UserWithRecipesSerializer(
-            instance.author,
+            author,
             context=context
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def delete_relation_author_with_user(model, author, user, request):
-        try:
-            instance = model.objects.get(author=author, user=user)
-        except Exception as ex:
-            logger.debug(f'Ошибка: {ex}')
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        instance.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def delete_relation_author_with_user(model, author_id, user, request):
+        if model.objects.remove(user, author_id):
+            bump_relations(request)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, pk=author_id)
+        return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
         detail=True,
@@ -84,28 +163,85 @@ class UserViewSet(dj_views.UserViewSet):
         permission_classes=[IsAuthenticated],
     )
     def subscribe(self, request, id=None):
-        author = get_object_or_404(User, pk=id)
+        author_id = parse_pk(id)
         if request.method == 'POST':
             return self.create_relation_author_with_user(
                 Subscription,
-                author,
+                get_object_or_404(
+                    UserWithRecipesSerializer.setup_eager_loading(
+                        User.objects.filter(pk=author_id), request
+                    )
+                ),
                 request.user,
                 request,
             )
         if request.method == 'DELETE':
             return self.delete_relation_author_with_user(
                 Subscription,
-                author,
+                author_id,
                 request.user,
                 request,
             )
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def subscribe_batch(self, request):
+        serializer = RelationBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'DELETE':
+            Subscription.objects.remove_many(request.user, ids)
+            bump_relations(request)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if request.user.pk in ids:
+            return Response(
+                {'ids': ['Нельзя подписаться на самого себя.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        authors, error = fetch_batch(
+            UserWithRecipesSerializer.setup_eager_loading(
+                User.objects.filter(pk__in=ids), request
+            ),
+            ids,
+        )
+        if error:
+            return error
+        Subscription.objects.add_many(request.user, ids)
+        bump_relations(request)
+        serializer = UserWithRecipesSerializer(
+            authors,
+            many=True,
+            context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='events_ticket',
+        permission_classes=[IsAuthenticated],
+    )
+    def events_ticket(self, request):
+        return Response(
+            {'ticket': make_ticket(request.user)},
+            status=status.HTTP_201_CREATED,
+        )
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
+    def list(self, request, *args, **kwargs):
+        if settings.REFERENCE_DATA['ENABLED']:
+            return Response(reference_data().tags)
+        return super().list(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
@@ -119,29 +255,214 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_field_selection(self):
+        if self.action not in ['list', 'retrieve']:
+            return None
+        if not hasattr(self, '_field_selection'):
+            normalized = []
+            if self.action == 'list':
+                normalized = ['tags', 'ingredients']
+            self._field_selection = FieldSelection.from_request(
+                self.request,
+                RecipeSerializer.Meta.fields,
+                RecipeSerializer.collapsed_fields,
+                normalized,
+            )
+        return self._field_selection
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve', 'sync']:
+            return RecipeSerializer.setup_eager_loading(
+                queryset, self.get_field_selection()
+            )
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['field_selection'] = self.get_field_selection()
+        return context
+
     def get_serializer_class(self):
         actions = ['create', 'update', 'partial_update']
         if self.action in actions:
             return RecipeCreateSerializer
         return super().get_serializer_class()
 
+    def conditional_response(self, request, etag, get_response):
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = get_response()
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = make_etag(
+            request,
+            recipes_version(queryset),
+            request_relations_version(request),
+        )
+        return self.conditional_response(
+            request, etag, lambda: self.list_response(queryset)
+        )
+
+    def list_response(self, queryset):
+        if settings.API_FAST_SERIALIZATION:
+            page = self.paginate_queryset(RecipeValuesSerializer.values(
+                queryset, self.get_field_selection()
+            ))
+            serializer = RecipeValuesSerializer(
+                page,
+                many=True,
+                context=self.get_serializer_context(),
+            )
+        else:
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        if self.get_field_selection().normalize:
+            response.data['included'] = included_objects(serializer.data)
+        if facets_requested(self.request):
+            response.data['facets'] = recipe_facets(queryset, self.request)
+        return response
+
+    @action(
+        detail=False,
+        url_path='sync',
+    )
+    def sync(self, request):
+        server_time = timezone.now()
+        params = SyncParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        changed_since = params.validated_data.get('changed_since')
+
+        recipes, next_cursor = changed_recipes(
+            self.get_queryset(),
+            changed_since,
+            params.validated_data.get('position'),
+            params.validated_data['limit'],
+        )
+        serializer = RecipeSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response({
+            'server_time': server_time.isoformat(),
+            'next': next_cursor,
+            'recipes': {
+                'changed': serializer.data,
+                'deleted': sorted(
+                    deleted_ids(Tombstone.RECIPE, changed_since)
+                ),
+            },
+            **user_changes(request.user, changed_since),
+        })
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = make_etag(
+            request,
+            recipe_version(kwargs[self.lookup_field]),
+            request_relations_version(request),
+        )
+        return self.conditional_response(
+            request,
+            etag,
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        enqueue('recipe.created', {'id': recipe.id})
+        transaction.on_commit(lambda: publish_recipe_created(recipe))
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        recipe = serializer.save()
+        enqueue('recipe.updated', {'id': recipe.id})
+        bump_plans_with_recipe(recipe.id)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        enqueue('recipe.deleted', {
+            'id': instance.id,
+            'similar_to': list(SimilarRecipe.objects.filter(
+                similar_id=instance.id
+            ).values_list('recipe_id', flat=True)),
+        })
+        instance.delete()
+
+    @action(
+        detail=True,
+        url_path='similar',
+    )
+    def similar(self, request, pk=None):
+        recipe_id = parse_pk(pk)
+        recipes = [
+            item.similar for item in SimilarRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).select_related('similar').order_by('-score', 'similar_id')
+        ]
+        if not recipes:
+            get_object_or_404(Recipe, pk=recipe_id)
+        serializer = ShortRecipeSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        url_path='recommended',
+    )
+    def recommended(self, request):
+        recipes = []
+        if request.user.is_authenticated:
+            recipes = [
+                item.recipe for item in Recommendation.objects.filter(
+                    user=request.user
+                ).select_related('recipe').order_by('-score', 'recipe_id')
+            ]
+        if not recipes:
+            popular_ids = popular_recipe_ids()
+            popular = Recipe.objects.in_bulk(popular_ids)
+            recipes = [popular[pk] for pk in popular_ids if pk in popular]
+        serializer = ShortRecipeSerializer(
+            recipes,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
 
     @action(
         detail=False,
         url_path='download_shopping_cart',
         permission_classes=[IsAuthenticated],
+        throttle_classes=[
+            *api_settings.DEFAULT_THROTTLE_CLASSES, ExportThrottle
+        ],
     )
     def download_shopping_cart(self, request):
+        recipe_ids = list(RecipeInShoppingCart.objects.filter(
+            user=request.user
+        ).values_list('recipe_id', flat=True))
         recipe_ingredients = RecipeIngredient.objects.filter(
-            recipe__recipeinshoppingcart__user=request.user
+            recipe_id__in=recipe_ids
         ).values(
             'ingredient__name',
             'ingredient__measurement_unit'
         ).annotate(
             total=Sum('amount')
-        ).order_by()
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
 
         output = ''
         for recipe_ingredient in recipe_ingredients:
@@ -158,45 +479,99 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         return response
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='shopping_cart/clear',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_clear(self, request):
+        """
+        Очистка корзины после скачивания списка покупок. С ids удаляются
+        только эти рецепты, чтобы не потерять добавленные после скачивания.
+        """
+        if 'ids' in request.data:
+            serializer = RelationBatchSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            ids = serializer.validated_data['ids']
+        else:
+            ids = list(RecipeInShoppingCart.objects.filter(
+                user=request.user
+            ).values_list('recipe_id', flat=True))
+        RecipeInShoppingCart.objects.remove_many(request.user, ids)
+        bump_relations(request)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @staticmethod
     def create_relation_recipe_with_user(model, recipe, user, request):
-        try:
-            instance = model.objects.create(recipe=recipe, user=user)
-        except Exception as ex:
-            logger.error(f'Ошибка: {ex}')
+        if not model.objects.add(user, recipe.pk):
             return Response(status=status.HTTP_400_BAD_REQUEST)
+        bump_relations(request)
         context = {'request': request}
-        serializer = ShortRecipeSerializer(instance.recipe, context=context)
+        serializer = ShortRecipeSerializer(recipe, context=context)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def delete_relation_recipe_with_user(model, recipe, user, request):
-        try:
-            instance = model.objects.get(recipe=recipe, user=user)
-        except Exception as ex:
-            logger.error(f'Ошибка: {ex}')
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        instance.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    def delete_relation_recipe_with_user(model, recipe_id, user, request):
+        if model.objects.remove(user, recipe_id):
+            bump_relations(request)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=recipe_id)
+        return Response(status=status.HTTP_400_BAD_REQUEST)
 
-    @action(
-        detail=True,
-        methods=['post', 'delete'],
-        url_path='shopping_cart',
-        permission_classes=[IsAuthenticated],
-    )
-    def shopping_cart(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
+    @staticmethod
+    def relation_recipes_batch(model, user, request):
+        serializer = RelationBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'DELETE':
+            model.objects.remove_many(user, ids)
+            bump_relations(request)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        recipes, error = fetch_batch(Recipe.objects.all(), ids)
+        if error:
+            return error
+        model.objects.add_many(user, ids)
+        bump_relations(request)
+        context = {'request': request}
+        serializer = ShortRecipeSerializer(recipes, many=True, context=context)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def relation_recipe(self, model, request, pk):
+        recipe_id = parse_pk(pk)
         if request.method == 'POST':
             return self.create_relation_recipe_with_user(
-                RecipeInShoppingCart, recipe, request.user, request
+                model,
+                get_object_or_404(Recipe, pk=recipe_id),
+                request.user,
+                request,
             )
         if request.method == 'DELETE':
             return self.delete_relation_recipe_with_user(
-                RecipeInShoppingCart, recipe, request.user, request
+                model, recipe_id, request.user, request
             )
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    @action(
+        detail=True,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart(self, request, pk=None):
+        return self.relation_recipe(RecipeInShoppingCart, request, pk)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request):
+        return self.relation_recipes_batch(
+            RecipeInShoppingCart, request.user, request
+        )
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -204,20 +579,129 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def favorite(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if request.method == 'POST':
-            return self.create_relation_recipe_with_user(
-                FavoriteRecipe, recipe, request.user, request
-            )
-        if request.method == 'DELETE':
-            return self.delete_relation_recipe_with_user(
-                FavoriteRecipe, recipe, request.user, request
-            )
-        return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        return self.relation_recipe(FavoriteRecipe, request, pk)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, request):
+        return self.relation_recipes_batch(
+            FavoriteRecipe, request.user, request
+        )
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [IngredientFilter]
+    throttle_classes = [*api_settings.DEFAULT_THROTTLE_CLASSES, SearchThrottle]
     search_fields = ['^name']
+
+    def list(self, request, *args, **kwargs):
+        if settings.REFERENCE_DATA['ENABLED']:
+            terms = IngredientFilter().get_search_terms(request)
+            return Response(reference_data().search_ingredients(terms))
+        if not settings.API_FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = IngredientValuesSerializer(
+            IngredientValuesSerializer.values(queryset),
+            many=True,
+        )
+        return Response(serializer.data)
+
+
+class MealPlanViewSet(viewsets.ModelViewSet):
+    queryset = MealPlan.objects.all()
+    serializer_class = MealPlanSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = PageLimitPagination
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            user=self.request.user
+        ).prefetch_related('entries')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(
+        detail=True,
+        url_path='shopping_list',
+    )
+    def shopping_list(self, request, pk=None):
+        return Response(shopping_list(self.get_object()))
+
+    @action(
+        detail=True,
+        url_path='download_shopping_list',
+        throttle_classes=[
+            *api_settings.DEFAULT_THROTTLE_CLASSES, ExportThrottle
+        ],
+    )
+    def download_shopping_list(self, request, pk=None):
+        plan = self.get_object()
+        output = ''
+        for item in shopping_list(plan):
+            output += (
+                f'{item["name"]}({item["measurement_unit"]}) — '
+                f'{item["amount"]}\n'
+            )
+
+        file_name = f'foodgram_meal_plan_{plan.pk}'
+        response = HttpResponse(output, content_type='text/plain')
+        response['Content-Disposition'] = (
+            f'attachment; filename="{file_name}.txt"'
+        )
+        return response
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """Сохраненные профили запросов, только для staff."""
+    permission_classes = [IsStaff]
+    lookup_value_regex = r'[0-9]+-[0-9a-f]{8}'
+
+    def list(self, request):
+        profiles = []
+        for profile_id in list_profile_ids():
+            profile = load_profile(profile_id)
+            if profile is not None:
+                del profile['stacks']
+                profiles.append(profile)
+        return Response(profiles)
+
+    def retrieve(self, request, pk=None):
+        profile = load_profile(pk)
+        if profile is None:
+            raise Http404
+        if request.query_params.get('type') == 'speedscope':
+            response = HttpResponse(
+                json.dumps(speedscope_profile(profile)),
+                content_type='application/json',
+            )
+            extension = 'speedscope.json'
+        else:
+            response = HttpResponse(
+                collapsed_stacks(profile), content_type='text/plain'
+            )
+            extension = 'collapsed.txt'
+        response['Content-Disposition'] = (
+            f'attachment; filename="profile-{pk}.{extension}"'
+        )
+        return response
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='token',
+    )
+    def token(self, request):
+        header = settings.PROFILING['HEADER']
+        return Response({
+            'header': header[len('HTTP_'):].replace('_', '-').title(),
+            'token': make_token(),
+            'max_age': settings.PROFILING['TOKEN_MAX_AGE'],
+        })
@@ -4,4 +4,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+from api.events import RecipeEventsApp  # noqa: E402
+
+events_application = RecipeEventsApp()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == settings.EVENTS['PATH']:
+        return await events_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -26,7 +26,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +94,17 @@ STATIC_URL = '/static_backend/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static_backend')
 
+# Имена статических файлов содержат хеш содержимого, поэтому nginx
+# кеширует их навсегда. Нужен запуск collectstatic.
+STATICFILES_STORAGE = 'foodgram.storage.CompressedManifestStaticFilesStorage'
+
+STATIC_COMPRESSION_MIN_SIZE = 256
+
+STATIC_COMPRESSION_EXTENSIONS = [
+    '.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.eot',
+    '.ttf', '.otf',
+]
+
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -100,13 +113,213 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+# Redis для данных, общих для процессов (events, кеш).
+REDIS_URL = os.getenv('REDIS_URL')
+
+# С REDIS_URL кеш по умолчанию общий для процессов: в нем лимиты
+# запросов и версии снимков в памяти процессов.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', (
+            'django_redis.cache.RedisCache' if REDIS_URL
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        )),
+        'LOCATION': os.getenv('CACHE_LOCATION', REDIS_URL or ''),
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'api.permissions.ReadOnly',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.ClientThrottle',
+        'api.throttling.WriteThrottle',
+    ],
+    # IP клиента берется из X-Forwarded-For, который добавляет nginx.
+    'NUM_PROXIES': 1,
+}
+
+# Лимиты запросов (api.throttling): RATE - скорость пополнения корзины,
+# BURST - ее емкость. Для общего и атомарного лимита всех воркеров CACHE
+# должен указывать на django-redis.
+THROTTLING = {
+    'CACHE': os.getenv('THROTTLE_CACHE', 'default'),
+    'BUCKETS': {
+        'anon': {'RATE': '300/min', 'BURST': 60},
+        'user': {'RATE': '600/min', 'BURST': 120},
+        'write': {'RATE': '60/min', 'BURST': 20},
+        'export': {'RATE': '10/hour', 'BURST': 3},
+        'search': {'RATE': '120/min', 'BURST': 30},
+    },
+}
+
+# Сериализация списков рецептов и ингредиентов напрямую из .values()
+# в обход ModelSerializer. Формат ответа не меняется.
+API_FAST_SERIALIZATION = (
+    os.getenv('API_FAST_SERIALIZATION', 'False') == 'True'
+)
+
+API_COMPRESSION_MIN_SIZE = 1024
+
+API_COMPRESSION_CONTENT_TYPES = ['application/json']
+
+API_COMPRESSION_BROTLI_QUALITY = 5
+
+SYNC_DEFAULT_LIMIT = 100
+
+SYNC_MAX_LIMIT = 500
+
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+
+RELATION_BATCH_MAX_SIZE = 100
+
+# Счетчики для фильтров списка рецептов (?facets=1). Границы интервалов
+# времени приготовления в минутах, последний интервал открыт сверху.
+RECIPE_FACETS = {
+    'COOKING_TIME_BUCKETS': [15, 30, 60],
+    'CACHE_TTL': 30,
+}
+
+# Кеш пользователей по токену в общем для процессов кеше SHARED_CACHE
+# (алиас из CACHES, по умолчанию default при REDIS_URL). Без общего кеша
+# токены проверяются по базе: кеш процесса не узнал бы об их отзыве.
+AUTH_TOKEN_CACHE = {
+    'SHARED_CACHE': os.getenv(
+        'AUTH_TOKEN_SHARED_CACHE', 'default' if REDIS_URL else ''
+    ) or None,
+    'SHARED_TTL': 300,
+}
+
+# Снимки избранного, корзины и подписок пользователей (api.relations)
+# в памяти процесса. Снимок проверяется по версии связей, которую
+# менеджер и сигналы сбрасывают в общем для процессов кеше
+# VERSION_CACHE (по умолчанию default при REDIS_URL). Без общего кеша
+# версия считается по базе. TTL только освобождает память от снимков
+# неактивных пользователей.
+RELATIONS_CACHE = {
+    'MAXSIZE': 10000,
+    'TTL': 300,
+    'VERSION_CACHE': os.getenv(
+        'RELATIONS_VERSION_CACHE', 'default' if REDIS_URL else ''
+    ) or None,
+}
+
+# Снимок тегов и ингредиентов в памяти процесса (recipes.reference),
+# из которого отдаются списки /api/tags/ и /api/ingredients/. Снимок
+# проверяется по версии справочников из базы.
+REFERENCE_DATA = {
+    'ENABLED': os.getenv('REFERENCE_DATA_ENABLED', 'True') == 'True',
+}
+
+# Запросы, которыми gunicorn прогревает каждый воркер перед приемом
+# трафика (foodgram.warmup).
+WARMUP = {
+    'URLS': [
+        '/api/tags/',
+        '/api/ingredients/?name=а',
+        '/api/recipes/?limit=1',
+    ],
+}
+
+# Списки покупок планов питания (recipes.meal_plans). Ключ кеша включает
+# версию плана, поэтому TTL только освобождает память от старых версий.
+MEAL_PLANS = {
+    'CACHE_TTL': 60 * 60 * 24,
+}
+
+# Похожие рецепты (recipes.similarity): число соседей рецепта и
+# минимальное косинусное сходство. CHUNK_SIZE - число строк в одном
+# произведении матриц, ограничивает память расчета.
+SIMILAR_RECIPES = {
+    'NEIGHBORS': 10,
+    'MIN_SCORE': 0.05,
+    'CHUNK_SIZE': 256,
+}
+
+# Поиск дубликатов рецептов (recipes.duplicates): размер шингла в словах,
+# число LSH-полос и строк в полосе (длина сигнатуры BANDS * ROWS),
+# seed хеш-функций и минимальное сходство пары.
+DUPLICATES = {
+    'SHINGLE_SIZE': 3,
+    'BANDS': 16,
+    'ROWS': 8,
+    'SEED': 1,
+    'THRESHOLD': 0.8,
+}
+
+# Outbox (recipes.outbox): обработчики событий по темам, число попыток,
+# начальная задержка повтора и время аренды пачки воркером в секундах.
+# События тем без обработчиков (например, favoriterecipe.added) не
+# сохраняются.
+OUTBOX = {
+    'HANDLERS': {
+        'recipe.created': [
+            'recipes.duplicates.handle_recipe_event',
+            'recipes.similarity.handle_recipe_event',
+        ],
+        'recipe.updated': [
+            'recipes.duplicates.handle_recipe_event',
+            'recipes.similarity.handle_recipe_event',
+        ],
+        'recipe.deleted': ['recipes.similarity.handle_recipe_event'],
+    },
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+    'LEASE': 300,
+}
+
+# Семплирующий профилировщик запросов (api.profiling). Профилируются
+# запросы с подписанным заголовком X-Profile и доля SAMPLE_RATE
+# остальных; INTERVAL - период семплирования в секундах. Последние
+# MAX_PROFILES профилей хранятся в DIR и доступны staff в /api/profiles/.
+PROFILING = {
+    'ENABLED': os.getenv('PROFILING_ENABLED', 'False') == 'True',
+    'SAMPLE_RATE': float(os.getenv('PROFILING_SAMPLE_RATE', '0')),
+    'INTERVAL': 0.005,
+    'HEADER': 'HTTP_X_PROFILE',
+    'TOKEN_MAX_AGE': 3600,
+    'DIR': os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles')),
+    'MAX_PROFILES': 100,
+}
+
+# Рекомендации (recipes.recommendations): веса избранного и корзины,
+# число соседей рецепта, число рекомендаций пользователю и время
+# кеширования популярных рецептов для пользователей без рекомендаций.
+RECOMMENDATIONS = {
+    'FAVORITE_WEIGHT': 1.0,
+    'SHOPPING_CART_WEIGHT': 0.5,
+    'NEIGHBORS': 50,
+    'COUNT': 20,
+    'POPULAR_CACHE_TTL': 600,
+}
+
+# Поток событий о новых рецептах (api.events). BROKER - класс pub/sub:
+# RedisBroker раздает события всем процессам и используется, если задан
+# REDIS_URL; InProcessBroker работает в пределах одного процесса и
+# годится, только если API и события обслуживает один ASGI-воркер
+# (foodgram.asgi).
+EVENTS = {
+    'PATH': '/api/events/recipes/',
+    'BROKER': os.getenv('EVENTS_BROKER', (
+        'api.events.RedisBroker' if REDIS_URL
+        else 'api.events.InProcessBroker'
+    )),
+    'REDIS_URL': REDIS_URL,
+    'RECONNECT_DELAY': 1,
+    'HEARTBEAT': 15,
+    'FOLLOWING_TTL': 60,
+    'QUEUE_SIZE': 100,
+    'RESUME_LIMIT': 100,
+    # Время жизни билета для подключения без заголовка Authorization.
+    'TICKET_TTL': 60,
 }
 
 DJOSER = {
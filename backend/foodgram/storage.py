@@ -0,0 +1,42 @@
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Статика с хешем содержимого в имени файла и заранее сжатыми
+    копиями .gz и .br (если установлен brotli), которые nginx отдает
+    без сжатия на лету.
+    """
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            content = file.read()
+        if len(content) < settings.STATIC_COMPRESSION_MIN_SIZE:
+            return
+        variants = [('gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('br', brotli.compress(content, quality=11)))
+        for extension, compressed in variants:
+            if len(compressed) < len(content):
+                with open(f'{path}.{extension}', 'wb') as file:
+                    file.write(compressed)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Сжимаются итоговые имена: промежуточные имена файлов, в которых
+        # заменялись ссылки, удаляются после последнего прохода.
+        extensions = tuple(settings.STATIC_COMPRESSION_EXTENSIONS)
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if hashed_name.endswith(extensions):
+                self.compress(hashed_name)
@@ -4,13 +4,16 @@ from django.contrib import admin
 from django.urls import include, path
 from rest_framework import routers
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.views import (IngredientViewSet, MealPlanViewSet, ProfileViewSet,
+                       RecipeViewSet, TagViewSet, UserViewSet)
 
 router = routers.DefaultRouter()
 router.register(r'users', UserViewSet)
 router.register(r'tags', TagViewSet)
 router.register(r'recipes', RecipeViewSet)
 router.register(r'ingredients', IngredientViewSet)
+router.register(r'meal_plans', MealPlanViewSet)
+router.register(r'profiles', ProfileViewSet, basename='profiles')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
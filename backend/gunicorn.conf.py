@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+# API работает как WSGI на потоковых воркерах. Поток событий
+# (foodgram.asgi) запускается отдельным сервисом с
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(
+    os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+)
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Теплый запуск: приложение и справочники загружаются в мастере один
+# раз, воркеры получают их после fork и прогреваются до приема запросов.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+
+def when_ready(server):
+    # Вызывается в мастере до запуска воркеров.
+    if server.cfg.preload_app:
+        from foodgram.warmup import prepare
+        prepare(server.cfg.workers)
+
+
+def post_fork(server, worker):
+    # Соединение, унаследованное от мастера, только забывается: закрытие
+    # оборвало бы общий с мастером сокет.
+    if server.cfg.preload_app:
+        from django.db import connections
+        for connection in connections.all():
+            connection.connection = None
+
+
+def post_worker_init(worker):
+    if worker.cfg.preload_app:
+        from foodgram.warmup import check
+        check()
@@ -1,9 +1,54 @@
 from django.contrib import admin
-from django.db.models import Count
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
-from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, RecipeInShoppingCart, Tag
-                            )
+from recipes.meal_plans import bump_plans_with_recipe
+from recipes.models import (DuplicateCandidate, FavoriteRecipe, Ingredient,
+                            MealPlan, MealPlanEntry, OutboxEvent, Recipe,
+                            RecipeIngredient, RecipeInShoppingCart, Tag)
+
+
+def related_count(model, field):
+    """Количество строк model, ссылающихся на объект, подзапросом."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    ), 0)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который для таблиц без фильтра берет оценку количества
+    строк из статистики PostgreSQL вместо COUNT(*) по всей таблице.
+    """
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < self.EXACT_COUNT_LIMIT:
+            return super().count
+        return int(row[0])
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -11,7 +56,7 @@ class TagAdmin(admin.ModelAdmin):
 
     def get_queryset(self, *args, **kwargs):
         return super().get_queryset(*args, **kwargs).annotate(
-            usage_count=Count('recipe')
+            usage_count=related_count(Recipe.tags.through, 'tag')
         )
 
     def usage_count(self, obj):
@@ -25,10 +70,12 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = ['name', 'measurement_unit', 'usage_count']
 
     search_fields = ['name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, *args, **kwargs):
         return super().get_queryset(*args, **kwargs).annotate(
-            usage_count=Count('recipe')
+            usage_count=related_count(RecipeIngredient, 'ingredient')
         )
 
     def usage_count(self, obj):
@@ -42,15 +89,11 @@ class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
     min_num = 1
+    autocomplete_fields = ['ingredient']
+    ordering = ['ingredient__name', 'ingredient__measurement_unit']
 
-
-class RecipeInShoppingCartInline(admin.TabularInline):
-    model = RecipeInShoppingCart
-    extra = 1
-
-
-class FavoriteRecipeInline(admin.TabularInline):
-    model = FavoriteRecipe
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
 
 class RecipeAdmin(admin.ModelAdmin):
@@ -71,24 +114,41 @@ class RecipeAdmin(admin.ModelAdmin):
         'author__email',
     ]
 
+    list_select_related = ['author']
+    autocomplete_fields = ['author']
+    readonly_fields = ['favorite_count', 'shopping_cart_count']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     inlines = [
         RecipeIngredientInline,
-        RecipeInShoppingCartInline,
-        FavoriteRecipeInline,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            bump_plans_with_recipe(form.instance.pk)
+
     def get_queryset(self, *args, **kwargs):
-        return (
-            super().get_queryset(*args, **kwargs)
-            .annotate(
-                ingredient_count=Count('recipeingredient')
-            )
-            .annotate(
-                shopping_cart_count=Count('recipeinshoppingcart')
-            )
-            .annotate(
-                favorite_count=Count('favoriterecipe')
-            )
+        return super().get_queryset(*args, **kwargs).annotate(
+            ingredient_count=related_count(RecipeIngredient, 'recipe'),
+            shopping_cart_count=related_count(
+                RecipeInShoppingCart, 'recipe'
+            ),
+            favorite_count=related_count(FavoriteRecipe, 'recipe'),
+        )
+
+    def relation_link(self, obj, model, count):
+        # Корзины и избранное рецепта открываются отдельным списком
+        # с пагинацией, а не инлайном со всеми строками.
+        if obj.pk is None:
+            return count
+        url = reverse(
+            f'admin:{model._meta.app_label}_{model._meta.model_name}'
+            '_changelist'
+        )
+        return format_html(
+            '<a href="{}?recipe__id__exact={}">{}</a>', url, obj.pk, count
         )
 
     def ingredient_count(self, obj):
@@ -98,18 +158,99 @@ class RecipeAdmin(admin.ModelAdmin):
     ingredient_count.admin_order_field = 'ingredient_count'
 
     def shopping_cart_count(self, obj):
-        return obj.shopping_cart_count
+        return self.relation_link(
+            obj, RecipeInShoppingCart, getattr(obj, 'shopping_cart_count', 0)
+        )
 
     shopping_cart_count.short_description = 'В корзине'
     shopping_cart_count.admin_order_field = 'shopping_cart_count'
 
     def favorite_count(self, obj):
-        return obj.favorite_count
+        return self.relation_link(
+            obj, FavoriteRecipe, getattr(obj, 'favorite_count', 0)
+        )
 
     favorite_count.short_description = 'В избранном'
     favorite_count.admin_order_field = 'favorite_count'
 
 
+class UserRecipeRelationAdmin(admin.ModelAdmin):
+    list_display = ['recipe', 'user']
+    list_select_related = ['recipe', 'user']
+    autocomplete_fields = ['recipe', 'user']
+    search_fields = ['recipe__name', 'user__username', 'user__email']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class DuplicateCandidateAdmin(admin.ModelAdmin):
+    list_display = [
+        'recipe',
+        'original',
+        'similarity',
+        'reviewed',
+        'created_at',
+    ]
+
+    list_filter = ['reviewed']
+    list_select_related = ['recipe', 'original']
+    raw_id_fields = ['recipe', 'original']
+    ordering = ['reviewed', '-similarity']
+    actions = ['mark_reviewed']
+
+    @admin.action(description='Отметить как проверенные')
+    def mark_reviewed(self, request, queryset):
+        queryset.update(reviewed=True)
+
+
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = [
+        'topic',
+        'status',
+        'attempts',
+        'available_at',
+        'created_at',
+    ]
+    list_filter = ['status', 'topic']
+    readonly_fields = ['last_error']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['retry']
+
+    @admin.action(description='Повторить обработку')
+    def retry(self, request, queryset):
+        queryset.update(
+            status=OutboxEvent.PENDING, attempts=0, available_at=timezone.now()
+        )
+
+
+class MealPlanEntryInline(admin.TabularInline):
+    model = MealPlanEntry
+    extra = 1
+    autocomplete_fields = ['recipe']
+
+
+class MealPlanAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'start_date', 'version', 'updated_at']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    search_fields = ['name', 'user__username', 'user__email']
+    readonly_fields = ['version']
+    inlines = [MealPlanEntryInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Новая версия сбрасывает закешированный список покупок.
+        MealPlan.objects.filter(pk=form.instance.pk).update(
+            version=F('version') + 1
+        )
+
+
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
+admin.site.register(FavoriteRecipe, UserRecipeRelationAdmin)
+admin.site.register(RecipeInShoppingCart, UserRecipeRelationAdmin)
+admin.site.register(DuplicateCandidate, DuplicateCandidateAdmin)
+admin.site.register(OutboxEvent, OutboxEventAdmin)
+admin.site.register(MealPlan, MealPlanAdmin)
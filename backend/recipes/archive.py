@@ -0,0 +1,67 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.models import ArchivedCartItem, RecipeInShoppingCart
+
+User = get_user_model()
+
+
+def inactive_users(cutoff):
+    return User.objects.filter(
+        Q(last_login__lt=cutoff)
+        | Q(last_login__isnull=True, date_joined__lt=cutoff)
+    )
+
+
+def archive_batch(queryset, batch_size):
+    """
+    Переносит пачку строк корзин в архив одной короткой транзакцией.
+    Строки выбираются и блокируются в той же транзакции, поэтому в архив
+    не попадают строки, удаленные пользователем после выборки; строки,
+    заблокированные другими транзакциями, пропускаются. Удаление идет
+    через менеджер, поэтому клиенты синхронизации узнают о нем как об
+    обычном удалении из корзины. Возвращает число строк.
+    """
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        rows = list(queryset[:batch_size])
+        by_user = defaultdict(list)
+        for row in rows:
+            by_user[row['user_id']].append(row['recipe_id'])
+        for user_id, recipe_ids in by_user.items():
+            RecipeInShoppingCart.objects.remove_many(
+                User(pk=user_id), recipe_ids
+            )
+        ArchivedCartItem.objects.bulk_create(
+            ArchivedCartItem(
+                user_id=row['user_id'],
+                recipe_id=row['recipe_id'],
+                added_at=row['updated_at'],
+            )
+            for row in rows
+        )
+    return len(rows)
+
+
+def archive_carts(inactive_days, batch_size=1000):
+    """
+    Переносит в ArchivedCartItem корзины пользователей, которые не
+    входили и не меняли корзину inactive_days дней. Работает пачками,
+    чтобы не держать долгих блокировок. Возвращает число строк.
+    """
+    cutoff = timezone.now() - timedelta(days=inactive_days)
+    queryset = RecipeInShoppingCart.objects.filter(
+        user__in=inactive_users(cutoff), updated_at__lt=cutoff
+    ).order_by('user_id', 'id').values('user_id', 'recipe_id', 'updated_at')
+    archived = 0
+    while True:
+        count = archive_batch(queryset, batch_size)
+        if not count:
+            return archived
+        archived += count
@@ -0,0 +1,214 @@
+import hashlib
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from recipes.models import (
+    DuplicateCandidate, Recipe, RecipeIngredient,
+    RecipeLSHBucket, RecipeSignature
+)
+
+# Простое число больше 2**32 для универсального хеширования.
+PRIME = 4294967311
+WORD_RE = re.compile(r'\w+')
+
+
+def feature_hash(feature):
+    return zlib.crc32(feature.encode())
+
+
+def text_shingles(text, size):
+    words = WORD_RE.findall(text.lower())
+    return {
+        ' '.join(words[start:start + size])
+        for start in range(max(len(words) - size + 1, 1 if words else 0))
+    }
+
+
+def recipe_features(recipe_ids):
+    """Хеши ингредиентов и шинглов названия и описания рецептов."""
+    size = settings.DUPLICATES['SHINGLE_SIZE']
+    features = {
+        recipe['id']: {
+            feature_hash(f'w:{shingle}') for shingle in text_shingles(
+                f'{recipe["name"]} {recipe["text"]}', size
+            )
+        }
+        for recipe in Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values('id', 'name', 'text')
+    }
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by().values_list('recipe_id', 'ingredient_id'):
+        features[recipe_id].add(feature_hash(f'i:{ingredient_id}'))
+    return {
+        recipe_id: np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        for recipe_id, hashes in features.items()
+    }
+
+
+class MinHasher:
+    """
+    MinHash-сигнатуры множеств признаков и их LSH-корзины.
+
+    Доля совпадающих позиций двух сигнатур оценивает коэффициент
+    Жаккара множеств. Сигнатура делится на BANDS полос по ROWS
+    значений, рецепты с совпадающей полосой становятся кандидатами,
+    поэтому сравниваются только они, а не все пары.
+    """
+
+    def __init__(self, bands, rows, seed):
+        self.bands = bands
+        self.rows = rows
+        generator = np.random.default_rng(seed)
+        size = bands * rows
+        # a < 2**32 и признак < 2**32, произведение помещается в uint64.
+        self.a = generator.integers(1, 2 ** 32, size, dtype=np.uint64)
+        self.b = generator.integers(0, PRIME, size, dtype=np.uint64)
+
+    @classmethod
+    def from_settings(cls):
+        options = settings.DUPLICATES
+        return cls(options['BANDS'], options['ROWS'], options['SEED'])
+
+    def signature(self, features):
+        if not len(features):
+            return np.full(self.bands * self.rows, PRIME, dtype=np.uint64)
+        hashes = (self.a[:, None] * features[None, :]) % PRIME
+        return ((hashes + self.b[:, None]) % PRIME).min(axis=1)
+
+    def buckets(self, signature):
+        """Пары (полоса, корзина) сигнатуры."""
+        for band, values in enumerate(signature.reshape(self.bands, -1)):
+            digest = hashlib.blake2b(
+                band.to_bytes(2, 'big') + values.tobytes(), digest_size=8
+            ).digest()
+            yield band, int.from_bytes(digest, 'big', signed=True)
+
+
+def similarity(first, second):
+    return float(np.mean(first == second))
+
+
+def load_signatures(recipe_ids):
+    return {
+        recipe_id: np.frombuffer(signature, dtype=np.uint64)
+        for recipe_id, signature in RecipeSignature.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'signature')
+    }
+
+
+def save_signatures(hasher, signatures, computed_at):
+    recipe_ids = list(signatures)
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeLSHBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.bulk_create(
+            RecipeSignature(
+                recipe_id=recipe_id,
+                signature=signature.tobytes(),
+                computed_at=computed_at,
+            )
+            for recipe_id, signature in signatures.items()
+        )
+        RecipeLSHBucket.objects.bulk_create(
+            RecipeLSHBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+            for recipe_id, signature in signatures.items()
+            for band, bucket in hasher.buckets(signature)
+        )
+
+
+def find_candidates(hasher, signatures, threshold):
+    """
+    Пары (более новый рецепт, более старый, сходство) для рецептов из
+    signatures, у которых совпала хотя бы одна LSH-корзина.
+    """
+    # В одну корзину могут попасть несколько рецептов пакета.
+    buckets = defaultdict(set)
+    for recipe_id, signature in signatures.items():
+        for key in hasher.buckets(signature):
+            buckets[key].add(recipe_id)
+    pairs = set()
+    for recipe_id, band, bucket in RecipeLSHBucket.objects.filter(
+        bucket__in={bucket for _, bucket in buckets}
+    ).values_list('recipe_id', 'band', 'bucket'):
+        for other_id in buckets.get((band, bucket), ()):
+            if other_id != recipe_id:
+                pairs.add(
+                    (max(recipe_id, other_id), min(recipe_id, other_id))
+                )
+
+    known = dict(signatures)
+    known.update(load_signatures({
+        recipe_id for pair in pairs for recipe_id in pair
+        if recipe_id not in known
+    }))
+    for recipe_id, original_id in sorted(pairs):
+        score = similarity(known[recipe_id], known[original_id])
+        if score >= threshold:
+            yield recipe_id, original_id, score
+
+
+def detect_duplicates(recipe_ids, hasher=None):
+    """
+    Считает сигнатуры рецептов и сохраняет найденные для них возможные
+    дубликаты. Уже найденные пары сохраняют отметку о проверке.
+    Возвращает количество найденных пар.
+    """
+    hasher = hasher or MinHasher.from_settings()
+    computed_at = timezone.now()
+    signatures = {
+        recipe_id: hasher.signature(features)
+        for recipe_id, features in recipe_features(recipe_ids).items()
+    }
+    save_signatures(hasher, signatures, computed_at)
+    candidates = list(find_candidates(
+        hasher, signatures, settings.DUPLICATES['THRESHOLD']
+    ))
+    DuplicateCandidate.objects.bulk_create(
+        [
+            DuplicateCandidate(
+                recipe_id=recipe_id,
+                original_id=original_id,
+                similarity=score,
+            )
+            for recipe_id, original_id, score in candidates
+        ],
+        ignore_conflicts=True,
+    )
+    return len(candidates)
+
+
+def handle_recipe_event(payload):
+    """Обработчик событий outbox о создании и изменении рецепта."""
+    detect_duplicates([payload['id']])
+
+
+def build_duplicates(rebuild=False, batch_size=200):
+    """
+    Ищет дубликаты рецептов без сигнатуры или измененных после ее
+    расчета, а при rebuild — всех рецептов.
+    Возвращает количество проверенных рецептов и найденных пар.
+    """
+    recipes = Recipe.objects.order_by('id')
+    if not rebuild:
+        recipes = recipes.filter(
+            Q(signature__isnull=True)
+            | Q(updated_at__gt=F('signature__computed_at'))
+        )
+    recipe_ids = list(recipes.values_list('id', flat=True))
+    hasher = MinHasher.from_settings()
+    found = 0
+    for start in range(0, len(recipe_ids), batch_size):
+        found += detect_duplicates(
+            recipe_ids[start:start + batch_size], hasher
+        )
+    return len(recipe_ids), found
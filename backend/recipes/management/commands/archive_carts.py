@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from recipes.archive import archive_carts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит корзины неактивных пользователей в архив '
+        'пачками с короткими транзакциями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--inactive-days',
+            type=int,
+            default=180,
+            help='Сколько дней пользователь не входил и не менял корзину.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк корзин в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        count = archive_carts(
+            inactive_days=options['inactive_days'],
+            batch_size=options['batch_size'],
+        )
+        logger.info(f'Перенесено в архив строк корзин: {count}.')
@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import build_recommendations
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации рецептов по избранному и корзинам '
+        'пользователей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество пользователей и рецептов в одном пакете.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Количество строк, читаемых из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        users = build_recommendations(
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+        )
+        logger.info(f'Пользователей с рекомендациями: {users}.')
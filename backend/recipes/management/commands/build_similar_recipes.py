@@ -0,0 +1,36 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import build_similar_recipes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты по составу ингредиентов. '
+        'С --incremental пересчитываются только рецепты, затронутые '
+        'изменениями после прошлого расчета.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Пересчитать только затронутые изменениями рецепты.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество рецептов в одном пакете.',
+        )
+
+    def handle(self, *args, **options):
+        count = build_similar_recipes(
+            incremental=options['incremental'],
+            batch_size=options['batch_size'],
+        )
+        logger.info(f'Пересчитано рецептов: {count}.')
@@ -0,0 +1,38 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from recipes.duplicates import build_duplicates
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Ищет возможные дубликаты рецептов по MinHash-сигнатурам '
+        'ингредиентов и текста. По умолчанию проверяются только новые '
+        'и измененные рецепты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Пересчитать сигнатуры всех рецептов.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Количество рецептов в одном пакете.',
+        )
+
+    def handle(self, *args, **options):
+        checked, found = build_duplicates(
+            rebuild=options['rebuild'],
+            batch_size=options['batch_size'],
+        )
+        logger.info(
+            f'Проверено рецептов: {checked}, найдено пар: {found}.'
+        )
@@ -0,0 +1,25 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Tombstone
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет записи об удаленных объектах старше срока '
+        'SYNC_TOMBSTONE_RETENTION_DAYS.'
+    )
+
+    def handle(self, *args, **options):
+        border = timezone.now() - timedelta(
+            days=settings.SYNC_TOMBSTONE_RETENTION_DAYS
+        )
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=border).delete()
+        logger.info(f'Удалено записей: {deleted}.')
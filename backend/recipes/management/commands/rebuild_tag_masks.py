@@ -0,0 +1,35 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает маски тегов рецептов по связующей таблице.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество рецептов в одном UPDATE.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            updated += Recipe.objects.filter(
+                pk__gte=batch[0], pk__lte=batch[-1]
+            ).update_tags_mask()
+            last_id = batch[-1]
+        logger.info(f'Обновлено рецептов: {updated}.')
@@ -0,0 +1,50 @@
+import logging
+import os
+
+from django.core.management.base import BaseCommand
+
+from recipes.outbox import run_worker
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает события outbox пачками в пуле процессов '
+        'с повторами и статусом dead для необработанных событий.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Количество процессов-обработчиков.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Количество событий в одной пачке.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза между проверками пустого outbox в секундах.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Завершиться, когда готовых событий не останется.',
+        )
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+        )
+        logger.info(f'Обработано событий: {processed}.')
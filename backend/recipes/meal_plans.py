@@ -0,0 +1,130 @@
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, FloatField, Sum
+
+from recipes.models import MealPlan, MealPlanEntry
+
+SHOPPING_LIST_CACHE_KEY = 'meal_plan_shopping_list:{}:{}'
+
+# Единица измерения -> (базовая единица, множитель). Единицы, которых
+# нет в таблице, не пересчитываются.
+UNIT_CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+}
+
+# Базовая единица -> (крупная единица, множитель). Итог в крупной
+# единице показывается, если в ней получается хотя бы 1.
+DISPLAY_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+
+
+def plan_ingredients(plan):
+    """
+    Количества ингредиентов плана с учетом множителя порций, одним
+    запросом: массивы (названия, единицы, количества).
+    """
+    rows = MealPlanEntry.objects.filter(
+        plan=plan, recipe__recipeingredient__isnull=False
+    ).order_by().values_list(
+        'recipe__recipeingredient__ingredient__name',
+        'recipe__recipeingredient__ingredient__measurement_unit',
+    ).annotate(total=Sum(
+        F('recipe__recipeingredient__amount') * F('servings'),
+        output_field=FloatField(),
+    ))
+    names, units, totals = [], [], []
+    for name, unit, total in rows:
+        names.append(name)
+        units.append(unit)
+        totals.append(total)
+    return (
+        np.array(names, dtype=object),
+        np.array(units, dtype=object),
+        np.array(totals, dtype=np.float64),
+    )
+
+
+def normalize_units(names, units, totals):
+    """
+    Переводит количества в базовые единицы и суммирует одинаковые
+    ингредиенты. Возвращает массивы (названия, единицы, количества),
+    отсортированные по названию и единице.
+    """
+    conversions = [UNIT_CONVERSIONS.get(unit, (unit, 1)) for unit in units]
+    base_units = np.array(
+        [base for base, _ in conversions], dtype=object
+    )
+    factors = np.array(
+        [factor for _, factor in conversions], dtype=np.float64
+    )
+    keys = np.array(
+        [f'{name}\x00{unit}' for name, unit in zip(names, base_units)],
+        dtype=str,
+    )
+    keys, first, groups = np.unique(
+        keys, return_index=True, return_inverse=True
+    )
+    amounts = np.bincount(
+        groups, weights=totals * factors, minlength=len(keys)
+    )
+    return names[first], base_units[first], amounts
+
+
+def display_amounts(units, amounts):
+    """Крупные единицы для больших количеств: 1500 г -> 1.5 кг."""
+    units = units.copy()
+    amounts = amounts.copy()
+    for base, (unit, factor) in DISPLAY_UNITS.items():
+        mask = (units == base) & (amounts >= factor)
+        units[mask] = unit
+        amounts[mask] /= factor
+    return units, np.round(amounts, 2)
+
+
+def build_shopping_list(plan):
+    names, units, totals = plan_ingredients(plan)
+    if not len(names):
+        return []
+    names, units, amounts = normalize_units(names, units, totals)
+    units, amounts = display_amounts(units, amounts)
+    return [
+        {
+            'name': name,
+            'measurement_unit': unit,
+            'amount': int(amount) if amount.is_integer() else float(amount),
+        }
+        for name, unit, amount in zip(names, units, amounts)
+    ]
+
+
+def shopping_list(plan):
+    """
+    Список покупок плана, закешированный по версии плана: любое
+    изменение плана или его рецептов меняет ключ кеша.
+    """
+    key = SHOPPING_LIST_CACHE_KEY.format(plan.pk, plan.version)
+    items = cache.get(key)
+    if items is None:
+        items = build_shopping_list(plan)
+        cache.set(key, items, settings.MEAL_PLANS['CACHE_TTL'])
+    return items
+
+
+def bump_plans_with_recipe(recipe_id):
+    """Новые версии планов с рецептом, у которого изменился состав."""
+    MealPlan.objects.filter(entries__recipe_id=recipe_id).update(
+        version=F('version') + 1
+    )
+
+
+def bump_plans_with_ingredient(ingredient_id):
+    """Новые версии планов с рецептами, в которых есть ингредиент."""
+    MealPlan.objects.filter(
+        entries__recipe__ingredients=ingredient_id
+    ).update(version=F('version') + 1)
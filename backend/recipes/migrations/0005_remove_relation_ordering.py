@@ -0,0 +1,29 @@
+# Generated by Django 3.2.16 on 2026-10-19 02:23
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_relation_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='favoriterecipe',
+            options={'verbose_name': 'Рецепт в избранном', 'verbose_name_plural': 'Рецепт в избранном'},
+        ),
+        migrations.AlterModelOptions(
+            name='recipeingredient',
+            options={'verbose_name': 'Ингредиент рецепта', 'verbose_name_plural': 'Ингредиенты рецепта'},
+        ),
+        migrations.AlterModelOptions(
+            name='recipeinshoppingcart',
+            options={'verbose_name': 'Рецепт в корзине', 'verbose_name_plural': 'Рецепт в корзинах'},
+        ),
+        migrations.AlterModelOptions(
+            name='subscription',
+            options={'verbose_name': 'Подписка на автора', 'verbose_name_plural': 'Подписки на авторов'},
+        ),
+    ]
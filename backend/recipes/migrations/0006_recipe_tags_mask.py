@@ -0,0 +1,44 @@
+# Generated by Django 3.2.16 on 2026-10-19 02:30
+
+from django.db import migrations, models
+from django.db.models.functions import Cast, Coalesce
+
+# Значение TAGS_MASK_SIZE на момент миграции.
+TAGS_MASK_SIZE = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    bits = Recipe.tags.through.objects.filter(
+        recipe_id=models.OuterRef('pk'),
+        tag_id__lte=TAGS_MASK_SIZE,
+    ).order_by().values('recipe_id').annotate(
+        mask=models.Sum(models.ExpressionWrapper(
+            Cast(models.Value(1), models.BigIntegerField()).bitleftshift(
+                # В PostgreSQL сдвиг bigint определен только на integer.
+                Cast(models.F('tag_id') - 1, models.IntegerField())
+            ),
+            output_field=models.BigIntegerField(),
+        ))
+    ).values('mask')
+    Recipe.objects.update(tags_mask=Coalesce(
+        models.Subquery(bits),
+        models.Value(0),
+        output_field=models.BigIntegerField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_remove_relation_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
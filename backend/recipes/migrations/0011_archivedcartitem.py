@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-19 02:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(db_index=True, verbose_name='Пользователь')),
+                ('recipe_id', models.BigIntegerField(verbose_name='Рецепт')),
+                ('added_at', models.DateTimeField(verbose_name='Дата добавления')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Архивный рецепт в корзине',
+                'verbose_name_plural': 'Архивные рецепты в корзине',
+            },
+        ),
+    ]
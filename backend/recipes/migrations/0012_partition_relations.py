@@ -0,0 +1,207 @@
+import re
+
+from django.db import migrations, transaction
+
+# Избранное и корзина в PostgreSQL секционируются по хешу user_id:
+# запросы одного пользователя читают одну секцию и ее индексы.
+# В SQLite таблицы остаются обычными.
+PARTITIONS = 16
+TABLES = ['recipes_favoriterecipe', 'recipes_recipeinshoppingcart']
+# Строк, копируемых одной транзакцией.
+BATCH_SIZE = 10000
+
+INDEX_RE = re.compile(
+    r'^CREATE (?P<unique>UNIQUE )?INDEX (?P<name>\S+) ON (ONLY )?\S+ '
+)
+
+SYNC_FUNCTION = """
+CREATE FUNCTION {function}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        DELETE FROM {new} WHERE id = OLD.id AND user_id = OLD.user_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {new} SELECT NEW.* ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def table_definition(cursor, table):
+    """Ограничения, индексы и последовательность id таблицы."""
+    cursor.execute(
+        'SELECT conname, contype, pg_get_constraintdef(oid) '
+        'FROM pg_constraint WHERE conrelid = %s::regclass ORDER BY conname',
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        'SELECT indexdef FROM pg_indexes WHERE tablename = %s '
+        'AND indexname NOT IN ('
+        'SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass) '
+        'ORDER BY indexname',
+        [table, table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+    sequence = cursor.fetchone()[0]
+    return constraints, indexes, sequence
+
+
+def create_table(schema_editor, table, new, partitioned):
+    """
+    Пустая копия таблицы с временными именами ограничений и индексов.
+    Возвращает тройки (вид, временное имя, исходное имя).
+    """
+    quote = schema_editor.quote_name
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        constraints, indexes, _ = table_definition(cursor, table)
+    old = quote(table)
+    if partitioned:
+        execute(
+            f'CREATE TABLE {new} (LIKE {old} INCLUDING DEFAULTS) '
+            f'PARTITION BY HASH (user_id)'
+        )
+        for remainder in range(PARTITIONS):
+            execute(
+                f'CREATE TABLE {quote(f"{table}_p{remainder}_new")} '
+                f'PARTITION OF {new} FOR VALUES WITH '
+                f'(MODULUS {PARTITIONS}, REMAINDER {remainder})'
+            )
+    else:
+        execute(f'CREATE TABLE {new} (LIKE {old} INCLUDING DEFAULTS)')
+
+    names = []
+    for name, kind, definition in constraints:
+        if kind == 'p':
+            # Первичный ключ секционированной таблицы включает user_id.
+            definition = (
+                'PRIMARY KEY (id, user_id)' if partitioned
+                else 'PRIMARY KEY (id)'
+            )
+        temporary = f'{table}_c{len(names)}_new'
+        execute(
+            f'ALTER TABLE {new} ADD CONSTRAINT {quote(temporary)} '
+            f'{definition}'
+        )
+        names.append(('CONSTRAINT', temporary, name))
+    for definition in indexes:
+        match = INDEX_RE.match(definition)
+        temporary = f'{table}_i{len(names)}_new'
+        execute(
+            f'CREATE {match["unique"] or ""}INDEX {quote(temporary)} '
+            f'ON {new} {definition[match.end():]}'
+        )
+        names.append(('INDEX', temporary, match['name']))
+    return names
+
+
+def copy_rows(schema_editor, table, new):
+    """
+    Копирует строки пачками по BATCH_SIZE id, каждая пачка в своей
+    короткой транзакции. Строки пачки блокируются FOR SHARE, поэтому
+    удаление, начатое во время копирования, дождется пачки и удалит
+    строку и из новой таблицы через триггер.
+    """
+    connection = schema_editor.connection
+    old = schema_editor.quote_name(table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT min(id), max(id) FROM {old}')
+        first, last = cursor.fetchone()
+    if first is None:
+        return
+    for start in range(first, last + 1, BATCH_SIZE):
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute(
+                f'INSERT INTO {new} SELECT * FROM {old} '
+                f'WHERE id >= %s AND id < %s FOR SHARE '
+                f'ON CONFLICT DO NOTHING',
+                [start, start + BATCH_SIZE],
+            )
+
+
+def rebuild_table(schema_editor, table, partitioned):
+    """
+    Пересоздает таблицу секционированной или обычной без долгой
+    блокировки: новая таблица строится рядом, изменения старой
+    переносятся в нее триггером, данные копируются пачками, и только
+    замена таблиц и переименование выполняются под блокировкой.
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    execute = schema_editor.execute
+    old = quote(table)
+    new = quote(f'{table}_new')
+    function = quote(f'{table}_sync')
+    trigger = quote(f'{table}_sync')
+    with connection.cursor() as cursor:
+        _, _, sequence = table_definition(cursor, table)
+
+    with transaction.atomic(using=connection.alias):
+        # Остатки прерванного запуска: копия с секциями и триггер.
+        execute(f'DROP TABLE IF EXISTS {new}')
+        execute(f'DROP FUNCTION IF EXISTS {function}() CASCADE')
+        names = create_table(schema_editor, table, new, partitioned)
+        execute(SYNC_FUNCTION.format(function=function, new=new))
+        execute(
+            f'CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE '
+            f'ON {old} FOR EACH ROW EXECUTE FUNCTION {function}()'
+        )
+
+    copy_rows(schema_editor, table, new)
+
+    with transaction.atomic(using=connection.alias):
+        execute(f'LOCK TABLE {old} IN ACCESS EXCLUSIVE MODE')
+        execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+        execute(f'DROP TABLE {old}')
+        execute(f'DROP FUNCTION {function}()')
+        execute(f'ALTER TABLE {new} RENAME TO {old}')
+        for kind, temporary, name in names:
+            if kind == 'CONSTRAINT':
+                execute(
+                    f'ALTER TABLE {old} RENAME CONSTRAINT '
+                    f'{quote(temporary)} TO {quote(name)}'
+                )
+            else:
+                execute(
+                    f'ALTER INDEX {quote(temporary)} RENAME TO {quote(name)}'
+                )
+        if partitioned:
+            for remainder in range(PARTITIONS):
+                execute(
+                    f'ALTER TABLE {quote(f"{table}_p{remainder}_new")} '
+                    f'RENAME TO {quote(f"{table}_p{remainder}")}'
+                )
+        execute(f'ALTER SEQUENCE {sequence} OWNED BY {old}.id')
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        rebuild_table(schema_editor, table, partitioned=True)
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        rebuild_table(schema_editor, table, partitioned=False)
+
+
+class Migration(migrations.Migration):
+    # Таблицы копируются пачками в отдельных транзакциях.
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0011_archivedcartitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            partition_tables, unpartition_tables, atomic=False
+        ),
+    ]
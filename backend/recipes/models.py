@@ -1,13 +1,225 @@
+from decimal import Decimal
+
 from django.conf import settings
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce, RowNumber
+from django.dispatch import Signal
+from django.utils import timezone
 
 COLOR_VALIDATOR = RegexValidator(
     r'^#[a-fA-F0-9]{6}$',
     'Используйте RGB-формат для указания цвета (#FFFFFF)',
 )
 
+# Теги с id до TAGS_MASK_SIZE хранятся битами в Recipe.tags_mask,
+# теги с большими id ищутся через связующую таблицу.
+TAGS_MASK_SIZE = 63
+
+
+def tags_mask(tag_ids):
+    mask = 0
+    for tag_id in set(tag_ids):
+        if tag_id <= TAGS_MASK_SIZE:
+            mask |= 1 << (tag_id - 1)
+    return mask
+
+
+# Связи пользователя изменены менеджером, аргумент user_id. Менеджер
+# работает SQL-запросами, и post_save и post_delete не отправляются.
+relations_changed = Signal()
+
+
+class UserRelationManager(models.Manager):
+    """
+    Добавление и удаление связей пользователя с рецептом или автором.
+
+    Одиночные операции выполняются одним запросом: вставка с
+    ON CONFLICT DO NOTHING и удаление с проверкой числа строк.
+
+    Поля задаются атрибутами класса в наследниках: Django создает
+    менеджеры обратных связей (user.subscribing и т.п.) наследованием
+    от менеджера по умолчанию и вызывает их без аргументов.
+    """
+    target_field = None
+    tombstone_kind = None
+
+    def execute(self, sql, params):
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def columns(self):
+        connection = connections[self.db]
+        opts = self.model._meta
+        return [
+            connection.ops.quote_name(name) for name in (
+                opts.db_table,
+                opts.get_field(self.target_field).column,
+                opts.get_field('user').column,
+                opts.get_field('updated_at').column,
+            )
+        ]
+
+    def record_deletions(self, user, target_ids):
+        if self.tombstone_kind is None or not target_ids:
+            return
+        Tombstone.objects.using(self.db).bulk_create(
+            Tombstone(
+                kind=self.tombstone_kind, recipe_id=target_id, user=user
+            )
+            for target_id in target_ids
+        )
+
+    def record_event(self, user, action, target_ids):
+        topic = f'{self.model._meta.model_name}.{action}'
+        # Событие без обработчиков никто не разберет.
+        if not target_ids or topic not in settings.OUTBOX['HANDLERS']:
+            return
+        # Событие пишется в той же транзакции, что и изменение связи.
+        OutboxEvent.objects.using(self.db).create(
+            topic=topic,
+            payload={'user': user.pk, 'ids': list(target_ids)},
+        )
+
+    def record_change(self, user):
+        relations_changed.send(sender=self.model, user_id=user.pk)
+
+    def add(self, user, target_id):
+        table, target, user_column, updated_at = self.columns()
+        now = connections[self.db].ops.adapt_datetimefield_value(
+            timezone.now()
+        )
+        with transaction.atomic(using=self.db):
+            added = self.execute(
+                f'INSERT INTO {table} ({target}, {user_column}, {updated_at}) '
+                f'VALUES (%s, %s, %s) ON CONFLICT DO NOTHING',
+                [target_id, user.pk, now],
+            ) > 0
+            if added:
+                self.record_event(user, 'added', [target_id])
+                self.record_change(user)
+        return added
+
+    def remove(self, user, target_id):
+        table, target, user_column, _ = self.columns()
+        with transaction.atomic(using=self.db):
+            deleted = self.execute(
+                f'DELETE FROM {table} '
+                f'WHERE {user_column} = %s AND {target} = %s',
+                [user.pk, target_id],
+            )
+            if deleted:
+                self.record_deletions(user, [target_id])
+                self.record_event(user, 'removed', [target_id])
+                self.record_change(user)
+        return deleted > 0
+
+    def add_many(self, user, target_ids):
+        """
+        Добавляет связи одним запросом и возвращает число добавленных.
+        RETURNING отдает только вставленные строки, поэтому событие
+        не содержит уже существовавших связей.
+        """
+        target_ids = list(dict.fromkeys(target_ids))
+        if not target_ids:
+            return 0
+        table, target, user_column, updated_at = self.columns()
+        now = connections[self.db].ops.adapt_datetimefield_value(
+            timezone.now()
+        )
+        values = ', '.join(['(%s, %s, %s)'] * len(target_ids))
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table} '
+                    f'({target}, {user_column}, {updated_at}) '
+                    f'VALUES {values} ON CONFLICT DO NOTHING '
+                    f'RETURNING {target}',
+                    [
+                        value
+                        for target_id in target_ids
+                        for value in (target_id, user.pk, now)
+                    ],
+                )
+                added = [row[0] for row in cursor.fetchall()]
+            self.record_event(user, 'added', added)
+            if added:
+                self.record_change(user)
+        return len(added)
+
+    def remove_many(self, user, target_ids):
+        lookup = f'{self.target_field}_id'
+        table, target, user_column, _ = self.columns()
+        with transaction.atomic(using=self.db):
+            existing = list(self.filter(
+                user=user, **{f'{lookup}__in': target_ids}
+            ).values_list(lookup, flat=True))
+            if not existing:
+                return 0
+            placeholders = ', '.join(['%s'] * len(existing))
+            deleted = self.execute(
+                f'DELETE FROM {table} '
+                f'WHERE {user_column} = %s AND {target} IN ({placeholders})',
+                [user.pk, *existing],
+            )
+            self.record_deletions(user, existing)
+            self.record_event(user, 'removed', existing)
+            self.record_change(user)
+        return deleted
+
+
+class Tombstone(models.Model):
+    RECIPE = 'recipe'
+    FAVORITE = 'favorite'
+    SHOPPING_CART = 'shopping_cart'
+    KIND_CHOICES = [
+        (RECIPE, 'Рецепт'),
+        (FAVORITE, 'Рецепт в избранном'),
+        (SHOPPING_CART, 'Рецепт в корзине'),
+    ]
+
+    kind = models.CharField(
+        verbose_name='Тип объекта',
+        max_length=20,
+        choices=KIND_CHOICES,
+    )
+    recipe_id = models.BigIntegerField(
+        verbose_name='Рецепт',
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Пользователь',
+        related_name='+',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+    )
+    deleted_at = models.DateTimeField(
+        verbose_name='Дата удаления',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Удаленный объект'
+        verbose_name_plural = 'Удаленные объекты'
+        indexes = [
+            models.Index(
+                fields=['kind', 'user', 'deleted_at'],
+                name='recipes_tombstone_sync_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.recipe_id} {self.deleted_at}'
+
+
+class SubscriptionManager(UserRelationManager):
+    target_field = 'author'
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(
@@ -20,11 +232,17 @@ class Subscription(models.Model):
         related_name='subscribers',
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+
+    objects = SubscriptionManager()
 
     class Meta:
         verbose_name = 'Подписка на автора'
         verbose_name_plural = 'Подписки на авторов'
-        ordering = ['-author_id']
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
@@ -57,6 +275,11 @@ class Tag(models.Model):
         max_length=200,
         unique=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -78,6 +301,11 @@ class Ingredient(models.Model):
         max_length=200,
         blank=False,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -94,6 +322,64 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def filter_tags(self, tag_ids):
+        """
+        Рецепты хотя бы с одним из тегов.
+
+        Условие проверяется по маске тегов без соединения таблиц.
+        """
+        tag_ids = list(tag_ids)
+        condition = ~models.Q(tag_bits=0)
+        unmasked_ids = [pk for pk in tag_ids if pk > TAGS_MASK_SIZE]
+        if unmasked_ids:
+            condition |= models.Q(
+                pk__in=self.model.tags.through.objects.filter(
+                    tag_id__in=unmasked_ids
+                ).values('recipe_id')
+            )
+        return self.alias(
+            tag_bits=models.F('tags_mask').bitand(tags_mask(tag_ids))
+        ).filter(condition)
+
+    def latest_per_author(self, limit):
+        """
+        Последние limit рецептов каждого автора. Рецепты нумеруются
+        ROW_NUMBER() внутри автора от новых к старым; фильтровать по
+        оконной функции Django не умеет, поэтому нумерация — подзапрос.
+        """
+        ranked = self.annotate(place=models.Window(
+            RowNumber(),
+            partition_by=models.F('author_id'),
+            order_by=[models.F('pub_date').desc(), models.F('id').desc()],
+        )).order_by().values('id', 'place')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE place <= %s',
+            (*params, limit),
+        ))
+
+    def update_tags_mask(self):
+        """Пересчитывает маску тегов по связующей таблице."""
+        bits = self.model.tags.through.objects.filter(
+            recipe_id=models.OuterRef('pk'),
+            tag_id__lte=TAGS_MASK_SIZE,
+        ).order_by().values('recipe_id').annotate(
+            mask=models.Sum(models.ExpressionWrapper(
+                Cast(models.Value(1), models.BigIntegerField()).bitleftshift(
+                    # В PostgreSQL сдвиг bigint определен только на integer.
+                    Cast(models.F('tag_id') - 1, models.IntegerField())
+                ),
+                output_field=models.BigIntegerField(),
+            ))
+        ).values('mask')
+        return self.update(tags_mask=Coalesce(
+            models.Subquery(bits),
+            models.Value(0),
+            output_field=models.BigIntegerField(),
+        ))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -121,6 +407,11 @@ class Recipe(models.Model):
         Tag,
         verbose_name='Теги',
     )
+    tags_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        editable=False,
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления',
         validators=[MinValueValidator(1), MaxValueValidator(1440)],
@@ -129,11 +420,28 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date'],
+                name='recipes_recipe_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipes_recipe_author_pub_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}'
@@ -158,18 +466,28 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
-        ordering = ['ingredient', 'recipe']
         constraints = [
             models.UniqueConstraint(
                 fields=['ingredient', 'recipe'],
                 name='%(app_label)s_%(class)s_unique_relationships',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient', 'amount'],
+                name='recipes_ri_recipe_ingr_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient} {self.recipe} {self.amount}'
 
 
+class FavoriteRecipeManager(UserRelationManager):
+    target_field = 'recipe'
+    tombstone_kind = Tombstone.FAVORITE
+
+
 class FavoriteRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -179,22 +497,39 @@ class FavoriteRecipe(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+
+    objects = FavoriteRecipeManager()
 
     class Meta:
         verbose_name = 'Рецепт в избранном'
         verbose_name_plural = 'Рецепт в избранном'
-        ordering = ['recipe', 'user']
         constraints = [
             models.UniqueConstraint(
                 fields=['recipe', 'user'],
                 name='%(app_label)s_%(class)s_unique_relationships',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='recipes_fav_user_recipe_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.user}'
 
 
+class RecipeInShoppingCartManager(UserRelationManager):
+    target_field = 'recipe'
+    tombstone_kind = Tombstone.SHOPPING_CART
+
+
 class RecipeInShoppingCart(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -204,17 +539,353 @@ class RecipeInShoppingCart(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+
+    objects = RecipeInShoppingCartManager()
 
     class Meta:
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепт в корзинах'
-        ordering = ['recipe', 'user']
         constraints = [
             models.UniqueConstraint(
                 fields=['recipe', 'user'],
                 name='%(app_label)s_%(class)s_unique_relationships',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='recipes_cart_user_recipe_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.user}'
+
+
+class ArchivedCartItem(models.Model):
+    """
+    Рецепт из корзины неактивного пользователя, перенесенный из
+    RecipeInShoppingCart командой archive_carts. Без внешних ключей,
+    чтобы архив не участвовал в каскадных удалениях.
+    """
+    user_id = models.BigIntegerField(
+        verbose_name='Пользователь',
+        db_index=True,
+    )
+    recipe_id = models.BigIntegerField(
+        verbose_name='Рецепт',
+    )
+    added_at = models.DateTimeField(
+        verbose_name='Дата добавления',
+    )
+    archived_at = models.DateTimeField(
+        verbose_name='Дата архивации',
+        default=timezone.now,
+    )
+
+    class Meta:
+        verbose_name = 'Архивный рецепт в корзине'
+        verbose_name_plural = 'Архивные рецепты в корзине'
+
+    def __str__(self):
+        return f'{self.recipe_id} {self.user_id}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='similar_recipes',
+        on_delete=models.CASCADE,
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        verbose_name='Похожий рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчета',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='%(app_label)s_%(class)s_unique_relationships',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='recipes_similar_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.similar} {self.score:.3f}'
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Пользователь',
+        related_name='recommendations',
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField(
+        verbose_name='Оценка',
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчета',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='%(app_label)s_%(class)s_unique_relationships',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-score'],
+                name='recipes_recommend_score_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe} {self.score:.3f}'
+
+
+class RecipeSignature(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='signature',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    signature = models.BinaryField(
+        verbose_name='MinHash-сигнатура',
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчета',
+        default=timezone.now,
+    )
+
+    class Meta:
+        verbose_name = 'Сигнатура рецепта'
+        verbose_name_plural = 'Сигнатуры рецептов'
+
+    def __str__(self):
+        return f'{self.recipe} {self.computed_at}'
+
+
+class RecipeLSHBucket(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    band = models.PositiveSmallIntegerField(
+        verbose_name='Полоса',
+    )
+    bucket = models.BigIntegerField(
+        verbose_name='Корзина',
+    )
+
+    class Meta:
+        verbose_name = 'LSH-корзина рецепта'
+        verbose_name_plural = 'LSH-корзины рецептов'
+        indexes = [
+            models.Index(
+                fields=['bucket', 'band'],
+                name='recipes_lsh_bucket_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.band} {self.bucket}'
+
+
+class DuplicateCandidate(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='duplicate_candidates',
+        on_delete=models.CASCADE,
+    )
+    original = models.ForeignKey(
+        Recipe,
+        verbose_name='Исходный рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    similarity = models.FloatField(
+        verbose_name='Сходство',
+    )
+    reviewed = models.BooleanField(
+        verbose_name='Проверен',
+        default=False,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата обнаружения',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Возможный дубликат'
+        verbose_name_plural = 'Возможные дубликаты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'original'],
+                name='%(app_label)s_%(class)s_unique_relationships',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.original} {self.similarity:.2f}'
+
+
+class OutboxEvent(models.Model):
+    PENDING = 'pending'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает обработки'),
+        (DEAD, 'Не обработано'),
+    ]
+
+    topic = models.CharField(
+        verbose_name='Тема',
+        max_length=100,
+    )
+    payload = models.JSONField(
+        verbose_name='Данные',
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Попыток',
+        default=0,
+    )
+    available_at = models.DateTimeField(
+        verbose_name='Доступно для обработки с',
+        default=timezone.now,
+    )
+    last_error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Событие outbox'
+        verbose_name_plural = 'События outbox'
+        indexes = [
+            models.Index(
+                fields=['status', 'available_at'],
+                name='recipes_outbox_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.topic} {self.status}'
+
+
+class MealPlan(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Пользователь',
+        related_name='meal_plans',
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(
+        verbose_name='Название',
+        max_length=200,
+    )
+    start_date = models.DateField(
+        verbose_name='Дата начала',
+    )
+    version = models.PositiveIntegerField(
+        verbose_name='Версия',
+        default=1,
+        editable=False,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'План питания'
+        verbose_name_plural = 'Планы питания'
+        ordering = ['-start_date', '-id']
+
+    def __str__(self):
+        return f'{self.name} {self.start_date}'
+
+
+class MealPlanEntry(models.Model):
+    plan = models.ForeignKey(
+        MealPlan,
+        verbose_name='План питания',
+        related_name='entries',
+        on_delete=models.CASCADE,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    date = models.DateField(
+        verbose_name='День',
+    )
+    servings = models.DecimalField(
+        verbose_name='Множитель порций',
+        max_digits=5,
+        decimal_places=2,
+        default=1,
+        validators=[
+            MinValueValidator(Decimal('0.25')),
+        ],
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт плана питания'
+        verbose_name_plural = 'Рецепты плана питания'
+        ordering = ['date', 'id']
+
+    def __str__(self):
+        return f'{self.plan} {self.date} {self.recipe}'
@@ -0,0 +1,126 @@
+import logging
+import multiprocessing
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from recipes.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(topic, payload):
+    """
+    Добавляет событие в outbox. Вызывается внутри транзакции изменения,
+    поэтому событие сохраняется, только если изменение зафиксировано.
+    События тем без обработчиков в OUTBOX['HANDLERS'] не сохраняются.
+    """
+    if topic not in settings.OUTBOX['HANDLERS']:
+        return None
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def topic_handlers(topic):
+    return [
+        import_string(path)
+        for path in settings.OUTBOX['HANDLERS'].get(topic, [])
+    ]
+
+
+def run_handlers(topic, payload):
+    """Выполняется в процессе пула: все обработчики темы по очереди."""
+    close_old_connections()
+    try:
+        for handler in topic_handlers(topic):
+            handler(payload)
+    finally:
+        close_old_connections()
+
+
+def claim_events(batch_size):
+    """
+    Забирает пачку готовых к обработке событий и откладывает их на
+    LEASE секунд, чтобы другие воркеры их не взяли. Если воркер упадет,
+    события снова станут доступны после окончания аренды.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutboxEvent.objects.filter(
+            status=OutboxEvent.PENDING, available_at__lte=now
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        events = list(queryset[:batch_size])
+        OutboxEvent.objects.filter(
+            pk__in=[event.pk for event in events]
+        ).update(
+            available_at=now + timedelta(seconds=settings.OUTBOX['LEASE'])
+        )
+    return events
+
+
+def record_failure(event, error):
+    event.attempts += 1
+    event.last_error = error
+    if event.attempts >= settings.OUTBOX['MAX_ATTEMPTS']:
+        event.status = OutboxEvent.DEAD
+        logger.error(f'Событие {event.pk} {event.topic} не обработано.')
+    else:
+        delay = settings.OUTBOX['RETRY_DELAY'] * 2 ** (event.attempts - 1)
+        event.available_at = timezone.now() + timedelta(seconds=delay)
+    event.save(update_fields=[
+        'attempts', 'last_error', 'status', 'available_at'
+    ])
+
+
+def process_batch(executor, events):
+    """Обрабатывает события в пуле процессов. Возвращает число успешных."""
+    futures = {
+        executor.submit(run_handlers, event.topic, event.payload): event
+        for event in events
+    }
+    wait(futures)
+    done = []
+    for future, event in futures.items():
+        error = future.exception()
+        if error is None:
+            done.append(event.pk)
+        else:
+            record_failure(event, ''.join(traceback.format_exception(
+                type(error), error, error.__traceback__
+            )))
+    OutboxEvent.objects.filter(pk__in=done).delete()
+    return len(done)
+
+
+def run_worker(workers, batch_size, poll_interval, once=False):
+    """
+    Разбирает outbox пачками. Обработчики выполняются в отдельных
+    процессах; при ошибке событие повторяется с растущей задержкой,
+    после OUTBOX['MAX_ATTEMPTS'] попыток получает статус dead.
+    С once воркер завершается, когда готовых событий не осталось.
+    """
+    processed = 0
+    # Процессы пула запускаются через spawn и сами настраивают Django,
+    # чтобы не наследовать открытые соединения с базой.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    ) as executor:
+        while True:
+            events = claim_events(batch_size)
+            if not events:
+                if once:
+                    return processed
+                time.sleep(poll_interval)
+                continue
+            processed += process_batch(executor, events)
+            logger.info(f'Обработано событий: {processed}.')
@@ -0,0 +1,176 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from recipes.models import (
+    FavoriteRecipe, RecipeInShoppingCart, Recommendation
+)
+
+INTERACTION_MODELS = [
+    (FavoriteRecipe, 'FAVORITE_WEIGHT'),
+    (RecipeInShoppingCart, 'SHOPPING_CART_WEIGHT'),
+]
+
+
+def load_interactions(chunk_size):
+    """
+    Взаимодействия пользователей с рецептами в виде массивов
+    (user_ids, recipe_ids, weights). Строки читаются порциями, чтобы
+    не держать в памяти объекты Python для всей таблицы.
+    """
+    user_ids, recipe_ids, weights = [], [], []
+    for model, weight_name in INTERACTION_MODELS:
+        rows = model.objects.order_by().values_list(
+            'user_id', 'recipe_id'
+        ).iterator(chunk_size=chunk_size)
+        pairs = np.fromiter(
+            (value for row in rows for value in row), dtype=np.int64
+        ).reshape(-1, 2)
+        user_ids.append(pairs[:, 0])
+        recipe_ids.append(pairs[:, 1])
+        weights.append(np.full(
+            len(pairs),
+            settings.RECOMMENDATIONS[weight_name],
+            dtype=np.float32,
+        ))
+    return (
+        np.concatenate(user_ids),
+        np.concatenate(recipe_ids),
+        np.concatenate(weights),
+    )
+
+
+def top_k(matrix, k, exclude=None):
+    """
+    Для каждой строки разреженной матрицы — k столбцов с наибольшими
+    значениями в виде пар массивов (столбцы, значения).
+    """
+    matrix = matrix.tocsr()
+    if exclude is not None:
+        # Убираем из результатов уже известные пользователю рецепты.
+        matrix = matrix - matrix.multiply(exclude > 0)
+        matrix.eliminate_zeros()
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        columns = matrix.indices[start:end]
+        values = matrix.data[start:end]
+        if len(values) > k:
+            top = np.argpartition(-values, k)[:k]
+            columns, values = columns[top], values[top]
+        order = np.lexsort((columns, -values))
+        yield columns[order], values[order]
+
+
+class ItemItemRecommender:
+    """
+    Рекомендации по сходству рецептов (item-item).
+
+    Сходство рецептов — косинус столбцов матрицы пользователь × рецепт,
+    у каждого рецепта хранится только NEIGHBORS ближайших соседей.
+    Оценка рецепта для пользователя — сумма сходств с рецептами,
+    которые он уже добавлял. Все вычисления идут пакетами, поэтому
+    память ограничена размером пакета и разреженных матриц.
+    """
+
+    def __init__(self, user_ids, recipe_ids, weights, batch_size):
+        self.user_ids, user_rows = np.unique(user_ids, return_inverse=True)
+        self.recipe_ids, recipe_columns = np.unique(
+            recipe_ids, return_inverse=True
+        )
+        self.batch_size = batch_size
+        # Повторяющиеся пары суммируются: рецепт в избранном и корзине.
+        self.interactions = sparse.csr_matrix(
+            (weights, (user_rows, recipe_columns)),
+            shape=(len(self.user_ids), len(self.recipe_ids)),
+            dtype=np.float32,
+        )
+        self.similarity = self.item_similarity(
+            settings.RECOMMENDATIONS['NEIGHBORS']
+        )
+
+    def item_similarity(self, neighbors):
+        items = self.interactions.T.tocsr()
+        norms = np.sqrt(np.asarray(
+            items.multiply(items).sum(axis=1)
+        ).ravel())
+        items = (sparse.diags(1 / norms) @ items).tocsr()
+        rows, columns, values = [], [], []
+        for start in range(0, items.shape[0], self.batch_size):
+            product = (items[start:start + self.batch_size] @ items.T).tocsr()
+            product.setdiag(0, k=start)
+            product.eliminate_zeros()
+            for offset, (top_columns, top_values) in enumerate(
+                top_k(product, neighbors)
+            ):
+                rows.append(np.full(len(top_columns), start + offset))
+                columns.append(top_columns)
+                values.append(top_values)
+        size = items.shape[0]
+        if not rows:
+            return sparse.csr_matrix((size, size), dtype=np.float32)
+        return sparse.csr_matrix(
+            (
+                np.concatenate(values),
+                (np.concatenate(rows), np.concatenate(columns)),
+            ),
+            shape=(size, size),
+            dtype=np.float32,
+        )
+
+    def recommend(self, count):
+        """Пары (id пользователя, [(id рецепта, оценка), ...])."""
+        for start in range(0, len(self.user_ids), self.batch_size):
+            history = self.interactions[start:start + self.batch_size]
+            scores = history @ self.similarity
+            for offset, (columns, values) in enumerate(
+                top_k(scores, count, exclude=history)
+            ):
+                yield int(self.user_ids[start + offset]), [
+                    (int(self.recipe_ids[column]), float(value))
+                    for column, value in zip(columns, values)
+                ]
+
+
+def save_recommendations(batch, computed_at):
+    user_ids = [user_id for user_id, _ in batch]
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=user_ids).delete()
+        Recommendation.objects.bulk_create(
+            Recommendation(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                score=score,
+                computed_at=computed_at,
+            )
+            for user_id, recipes in batch
+            for recipe_id, score in recipes
+        )
+
+
+def build_recommendations(batch_size=1000, chunk_size=10000):
+    """
+    Пересчитывает рекомендации всех пользователей.
+    Возвращает количество пользователей с рекомендациями.
+    """
+    computed_at = timezone.now()
+    recommender = ItemItemRecommender(
+        *load_interactions(chunk_size), batch_size=batch_size
+    )
+    batch = []
+    users = 0
+    for user_id, recipes in recommender.recommend(
+        settings.RECOMMENDATIONS['COUNT']
+    ):
+        batch.append((user_id, recipes))
+        users += bool(recipes)
+        if len(batch) >= batch_size:
+            save_recommendations(batch, computed_at)
+            batch = []
+    if batch:
+        save_recommendations(batch, computed_at)
+    # Рекомендации пользователей, у которых не осталось взаимодействий;
+    # им отдаются популярные рецепты.
+    Recommendation.objects.filter(computed_at__lt=computed_at).delete()
+    return users
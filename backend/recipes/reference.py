@@ -0,0 +1,89 @@
+import bisect
+
+from django.db import connection
+
+from recipes.models import Ingredient, Tag
+
+# Символ больше любого другого: граница диапазона для поиска по началу.
+MAX_CHAR = '\U0010ffff'
+
+
+class ReferenceData:
+    """
+    Теги и справочник ингредиентов в памяти процесса.
+
+    Строки хранятся в порядке выдачи API, для поиска по началу названия
+    отдельно хранится отсортированный список названий в нижнем регистре.
+    Снимок, построенный в мастере gunicorn до fork, воркеры разделяют
+    как copy-on-write.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.tags = list(Tag.objects.values('id', 'name', 'color', 'slug'))
+        self.ingredients = list(Ingredient.objects.values(
+            'id', 'name', 'measurement_unit'
+        ))
+        index = sorted(
+            (row['name'].lower(), position)
+            for position, row in enumerate(self.ingredients)
+        )
+        self.names = [name for name, _ in index]
+        self.positions = [position for _, position in index]
+
+    def is_fresh(self, version):
+        return self.version == version
+
+    def prefix_positions(self, prefix):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.names, prefix)
+        end = bisect.bisect_left(self.names, prefix + MAX_CHAR, start)
+        return set(self.positions[start:end])
+
+    def search_ingredients(self, terms):
+        """Ингредиенты, названия которых начинаются с каждого из terms."""
+        if not terms:
+            return self.ingredients
+        positions = self.prefix_positions(terms[0])
+        for term in terms[1:]:
+            positions &= self.prefix_positions(term)
+        return [self.ingredients[position] for position in sorted(positions)]
+
+
+_reference_data = None
+
+
+def reference_version():
+    """
+    Версия справочников из базы одним запросом: число строк меняется
+    при удалении, наибольший updated_at — при добавлении и изменении.
+    Поэтому версия общая для всех процессов и учитывает изменения
+    в обход сигналов (bulk_create, другие процессы).
+    """
+    quote = connection.ops.quote_name
+    columns = []
+    for model in (Tag, Ingredient):
+        table = quote(model._meta.db_table)
+        updated_at = quote(model._meta.get_field('updated_at').column)
+        columns += [
+            f'(SELECT COUNT(*) FROM {table})',
+            f'(SELECT MAX({updated_at}) FROM {table})',
+        ]
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(columns)}')
+        return cursor.fetchone()
+
+
+def reference_data():
+    """
+    Актуальный снимок справочников: перестраивается, когда меняется
+    версия в базе. Изменения, не обновляющие updated_at (update() без
+    этого поля, SQL), видны только после нового снимка.
+    """
+    global _reference_data
+    version = reference_version()
+    data = _reference_data
+    if data is None or not data.is_fresh(version):
+        data = ReferenceData(version)
+        _reference_data = data
+    return data
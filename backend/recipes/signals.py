@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.meal_plans import (
+    bump_plans_with_ingredient, bump_plans_with_recipe
+)
+from recipes.models import (
+    FavoriteRecipe, Ingredient, Recipe,
+    RecipeInShoppingCart, Tag, Tombstone
+)
+
+
+def touch_recipes(queryset):
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Записи планов удаляются каскадно, список покупок меняется.
+    bump_plans_with_recipe(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(kind=Tombstone.RECIPE, recipe_id=instance.id)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def favorite_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        kind=Tombstone.FAVORITE,
+        recipe_id=instance.recipe_id,
+        user_id=instance.user_id,
+    )
+
+
+@receiver(post_delete, sender=RecipeInShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        kind=Tombstone.SHOPPING_CART,
+        recipe_id=instance.recipe_id,
+        user_id=instance.user_id,
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    Recipe.objects.filter_tags([instance.pk]).update_tags_mask()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        recipes = Recipe.objects.filter_tags([instance.pk])
+        if pk_set:
+            recipes = Recipe.objects.filter(pk__in=pk_set)
+        recipes.update_tags_mask()
+        return
+    # Маска в памяти может устареть, поэтому она пересчитывается в базе.
+    Recipe.objects.filter(pk=instance.pk).update_tags_mask()
+    instance.refresh_from_db(fields=['tags_mask'])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
+        bump_plans_with_ingredient(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
@@ -0,0 +1,246 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from scipy import sparse
+
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+
+def document_frequencies():
+    """
+    Число рецептов с каждым ингредиентом и общее число рецептов
+    с ингредиентами: IDF считается по всем рецептам, даже если матрица
+    строится только для части из них.
+    """
+    frequencies = dict(
+        RecipeIngredient.objects.order_by().values(
+            'ingredient_id'
+        ).annotate(count=Count('id')).values_list('ingredient_id', 'count')
+    )
+    total = RecipeIngredient.objects.order_by().values(
+        'recipe_id'
+    ).distinct().count()
+    return frequencies, total
+
+
+def candidate_recipes(recipe_ids):
+    """Рецепты хотя бы с одним общим ингредиентом с recipe_ids."""
+    return RecipeIngredient.objects.filter(
+        ingredient_id__in=RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id')
+    ).order_by().values('recipe_id')
+
+
+def keep_top(matrix, limit):
+    """
+    Оставляет в каждой строке не больше limit наибольших значений, из
+    равных — в столбцах с меньшими номерами. Порядок столбцов совпадает
+    с порядком id рецептов, поэтому выбор не зависит от того, по каким
+    рецептам построена матрица.
+    """
+    matrix.sort_indices()
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if end - start > limit:
+            values = matrix.data[start:end]
+            values[np.argsort(-values, kind='stable')[limit:]] = 0
+    matrix.eliminate_zeros()
+    return matrix
+
+
+class IngredientMatrix:
+    """
+    Разреженная матрица рецепт × ингредиент с весами TF-IDF.
+
+    Строки нормированы по длине, поэтому произведение строк равно
+    косинусному сходству рецептов. С recipes матрица строится только
+    для этих рецептов, веса при этом те же, что и в полной матрице.
+    """
+
+    def __init__(self, recipes=None):
+        pairs = RecipeIngredient.objects.order_by()
+        if recipes is not None:
+            pairs = pairs.filter(recipe_id__in=recipes)
+        pairs = np.array(
+            list(pairs.values_list('recipe_id', 'ingredient_id')),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        ingredient_ids, columns = np.unique(
+            pairs[:, 1], return_inverse=True
+        )
+        shape = (len(self.recipe_ids), len(ingredient_ids))
+        counts = sparse.csr_matrix(
+            (np.ones(len(pairs)), (rows, columns)), shape=shape
+        )
+
+        frequencies, total = document_frequencies()
+        document_frequency = np.array(
+            [frequencies.get(pk, 0) for pk in ingredient_ids],
+            dtype=np.float64,
+        )
+        idf = np.log((1 + total) / (1 + document_frequency)) + 1
+        weighted = counts @ sparse.diags(idf)
+        norms = np.sqrt(np.asarray(
+            weighted.multiply(weighted).sum(axis=1)
+        ).ravel())
+        self.matrix = (sparse.diags(1 / norms) @ weighted).tocsr()
+        self.row_by_id = {
+            recipe_id: row for row, recipe_id in enumerate(self.recipe_ids)
+        }
+
+    def rows(self, recipe_ids):
+        return np.array(
+            [self.row_by_id[pk] for pk in recipe_ids if pk in self.row_by_id],
+            dtype=np.int64,
+        )
+
+    def similarities(self, rows, min_score, limit=None):
+        """
+        Сходство строк rows со всеми рецептами не меньше min_score,
+        разреженная матрица. Произведение считается порциями по
+        CHUNK_SIZE строк, и в каждой строке порции остается не больше
+        limit значений, поэтому память не растет от общих ингредиентов.
+        """
+        chunk_size = settings.SIMILAR_RECIPES['CHUNK_SIZE']
+        transposed = self.matrix.T.tocsc()
+        parts = []
+        for start in range(0, len(rows), chunk_size):
+            product = self.matrix[rows[start:start + chunk_size]] @ transposed
+            product.data[product.data < min_score] = 0
+            product.eliminate_zeros()
+            if limit is not None:
+                product = keep_top(product.tocsr(), limit)
+            parts.append(product)
+        if not parts:
+            return sparse.csr_matrix((0, self.matrix.shape[0]))
+        return sparse.vstack(parts).tocsr()
+
+    def nearest(self, rows, neighbors, min_score):
+        """Пары (id рецепта, [(id соседа, сходство), ...])."""
+        # Сам рецепт тоже попадает в произведение, поэтому на одного больше.
+        product = self.similarities(rows, min_score, neighbors + 1)
+        for index, row in enumerate(rows):
+            start, end = product.indptr[index], product.indptr[index + 1]
+            columns = product.indices[start:end]
+            scores = product.data[start:end]
+            mask = columns != row
+            columns, scores = columns[mask], scores[mask]
+            order = np.lexsort((self.recipe_ids[columns], -scores))
+            order = order[:neighbors]
+            yield int(self.recipe_ids[row]), [
+                (int(self.recipe_ids[column]), float(score))
+                for column, score in zip(columns[order], scores[order])
+            ]
+
+
+def save_neighbors(recipe_ids, neighbors, computed_at):
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(
+                recipe_id=recipe_id,
+                similar_id=similar_id,
+                score=score,
+                computed_at=computed_at,
+            )
+            for recipe_id, similar in neighbors
+            for similar_id, score in similar
+        )
+
+
+def affected_recipes(changed_ids, neighbors, min_score):
+    """
+    Рецепты, списки соседей которых могли измениться вместе с
+    changed_ids: сами измененные рецепты, рецепты, у которых они были
+    в соседях, и рецепты, для которых они теперь ближе худшего соседа.
+    """
+    affected = set(changed_ids)
+    affected.update(SimilarRecipe.objects.filter(
+        similar_id__in=changed_ids
+    ).values_list('recipe_id', flat=True))
+
+    # Ненулевое сходство с измененными рецептами есть только у рецептов
+    # с общими ингредиентами.
+    candidates = candidate_recipes(changed_ids)
+    index = IngredientMatrix(candidates)
+    rows = index.rows(changed_ids)
+    if not len(rows):
+        return affected
+    lists = {
+        item['recipe_id']: (item['count'], item['worst'])
+        for item in SimilarRecipe.objects.filter(
+            recipe_id__in=candidates
+        ).order_by().values('recipe_id').annotate(
+            count=Count('id'), worst=Min('score')
+        )
+    }
+    product = index.similarities(rows, min_score).tocoo()
+    for column, score in zip(product.col, product.data):
+        recipe_id = int(index.recipe_ids[column])
+        count, worst = lists.get(recipe_id, (0, 0))
+        if count < neighbors or score > worst:
+            affected.add(recipe_id)
+    return affected
+
+
+def refresh_similar_recipes(changed_ids, batch_size=500, computed_at=None):
+    """
+    Пересчитывает соседей рецептов, затронутых изменением changed_ids.
+    Матрица каждого пакета строится только по рецептам пакета и их
+    кандидатам в соседи. Возвращает количество пересчитанных рецептов.
+    """
+    neighbors = settings.SIMILAR_RECIPES['NEIGHBORS']
+    min_score = settings.SIMILAR_RECIPES['MIN_SCORE']
+    computed_at = computed_at or timezone.now()
+    recipe_ids = sorted(affected_recipes(changed_ids, neighbors, min_score))
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        index = IngredientMatrix(candidate_recipes(batch))
+        save_neighbors(batch, index.nearest(
+            index.rows(batch), neighbors, min_score
+        ), computed_at)
+    return len(recipe_ids)
+
+
+def handle_recipe_event(payload):
+    """
+    Обработчик событий outbox о создании, изменении и удалении рецепта.
+    Строки соседей удаленного рецепта удаляются каскадно, поэтому
+    рецепты, у которых он был в соседях, передаются в similar_to.
+    """
+    refresh_similar_recipes([payload['id'], *payload.get('similar_to', [])])
+
+
+def build_similar_recipes(incremental=False, batch_size=500):
+    """
+    Пересчитывает соседей всех рецептов или, при incremental, только
+    рецептов, затронутых изменениями после прошлого расчета.
+    Возвращает количество пересчитанных рецептов.
+    """
+    neighbors = settings.SIMILAR_RECIPES['NEIGHBORS']
+    min_score = settings.SIMILAR_RECIPES['MIN_SCORE']
+    # Время начала, а не записи: рецепты, измененные во время расчета,
+    # попадут в следующий инкрементальный расчет.
+    started_at = timezone.now()
+
+    last_build = SimilarRecipe.objects.aggregate(
+        last=Max('computed_at')
+    )['last']
+    if incremental and last_build is not None:
+        changed_ids = list(Recipe.objects.filter(
+            updated_at__gt=last_build
+        ).values_list('id', flat=True))
+        return refresh_similar_recipes(changed_ids, batch_size, started_at)
+
+    index = IngredientMatrix()
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        save_neighbors(batch, index.nearest(
+            index.rows(batch), neighbors, min_score
+        ), started_at)
+    return len(recipe_ids)
@@ -0,0 +1,172 @@
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from recipes.duplicates import detect_duplicates
+from recipes.models import (
+    DuplicateCandidate, FavoriteRecipe, Ingredient, MealPlan, MealPlanEntry,
+    OutboxEvent, Recipe, RecipeIngredient, RecipeInShoppingCart, Subscription
+)
+
+User = get_user_model()
+
+
+def handle_event(payload):
+    pass
+
+
+class UserRelationManagerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='pass12345XX',
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=10
+        )
+
+    def test_reverse_accessors(self):
+        Subscription.objects.add(self.user, self.author.pk)
+        FavoriteRecipe.objects.add(self.user, self.recipe.pk)
+        RecipeInShoppingCart.objects.add(self.user, self.recipe.pk)
+
+        self.assertEqual(
+            list(self.user.subscribing.values_list('author_id', flat=True)),
+            [self.author.pk],
+        )
+        self.assertEqual(
+            list(self.author.subscribers.values_list('user_id', flat=True)),
+            [self.user.pk],
+        )
+        self.assertEqual(self.user.favoriterecipe_set.count(), 1)
+        self.assertEqual(self.recipe.favoriterecipe_set.count(), 1)
+        self.assertEqual(self.user.recipeinshoppingcart_set.count(), 1)
+        self.assertEqual(self.recipe.recipeinshoppingcart_set.count(), 1)
+
+    def test_add_and_remove(self):
+        self.assertTrue(FavoriteRecipe.objects.add(self.user, self.recipe.pk))
+        self.assertFalse(
+            FavoriteRecipe.objects.add(self.user, self.recipe.pk)
+        )
+        self.assertTrue(
+            FavoriteRecipe.objects.remove(self.user, self.recipe.pk)
+        )
+        self.assertFalse(
+            FavoriteRecipe.objects.remove(self.user, self.recipe.pk)
+        )
+
+
+class DuplicateDetectionTests(TestCase):
+    def test_pairs_within_batch(self):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='pass12345XX',
+        )
+        text = (
+            'Сварить бульон из говядины, добавить свеклу, капусту и '
+            'картофель, варить до готовности и подать со сметаной.'
+        )
+        recipe_ids = [
+            Recipe.objects.create(
+                author=author, name='Борщ', text=text, cooking_time=60
+            ).pk
+            for _ in range(3)
+        ]
+
+        self.assertEqual(detect_duplicates(recipe_ids), 3)
+        self.assertEqual(
+            set(DuplicateCandidate.objects.values_list(
+                'recipe_id', 'original_id'
+            )),
+            {
+                (recipe_ids[1], recipe_ids[0]),
+                (recipe_ids[2], recipe_ids[0]),
+                (recipe_ids[2], recipe_ids[1]),
+            },
+        )
+
+
+@override_settings(OUTBOX={
+    **settings.OUTBOX,
+    'HANDLERS': {'favoriterecipe.added': ['recipes.tests.handle_event']},
+})
+class RelationEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, name='Рецепт', text='Текст', cooking_time=10
+            )
+            for _ in range(3)
+        ]
+
+    def test_add_many_records_inserted_ids(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        FavoriteRecipe.objects.add(self.user, first)
+
+        added = FavoriteRecipe.objects.add_many(
+            self.user, [first, second, third, second]
+        )
+
+        self.assertEqual(added, 2)
+        self.assertEqual(
+            [
+                sorted(event.payload['ids'])
+                for event in OutboxEvent.objects.order_by('id')
+            ],
+            [[first], [second, third]],
+        )
+
+    def test_topics_without_handlers_are_skipped(self):
+        RecipeInShoppingCart.objects.add_many(
+            self.user, [recipe.pk for recipe in self.recipes]
+        )
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class MealPlanVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='pass12345XX'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Блины', text='Текст', cooking_time=30
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=200
+        )
+        self.plan = MealPlan.objects.create(
+            user=self.user, name='Неделя', start_date=date(2026, 1, 5)
+        )
+        MealPlanEntry.objects.create(
+            plan=self.plan, recipe=self.recipe, date=date(2026, 1, 5)
+        )
+
+    def version(self):
+        self.plan.refresh_from_db()
+        return self.plan.version
+
+    def test_ingredient_change(self):
+        self.ingredient.measurement_unit = 'кг'
+        self.ingredient.save()
+        self.assertEqual(self.version(), 2)
+
+    def test_recipe_deleted(self):
+        self.recipe.delete()
+        self.assertEqual(self.version(), 2)
+        self.assertFalse(self.plan.entries.exists())